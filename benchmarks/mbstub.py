@@ -0,0 +1,193 @@
+"""A local stand-in for the MusicBrainz XML web service, used by the benchmarks.
+
+Responses are built from the XML files in benchmarks/fixtures: every artist MBID gets its
+own copy of the recorded releases (with ids derived from the MBID), browse requests are
+paged with limit/offset like the real service, and requests above the configured rate are
+answered with 503 like musicbrainz.org does.
+
+    python -m benchmarks.mbstub --port 8000 --latency 0.05 --rate 50
+    python -m benchmarks.mbstub record <artist-mbid>   # refresh the fixtures from musicbrainz.org
+"""
+import argparse
+import itertools
+import os
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+METADATA_OPEN = '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" xmlns:ns2="http://musicbrainz.org/ns/ext#-2.0">'
+RELEASE_PATTERN = re.compile(r'<release id="[^"]+">.*?</release>', re.DOTALL)
+ID_PATTERN = re.compile(r'(<release(?:-group)? id=")([^"]+)(")')
+MBID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+RECORD_URLS = {
+    'release-browse.xml': 'https://musicbrainz.org/ws/2/release?artist={mbid}&type=album&inc=release-groups+url-rels&limit=100',
+    'artist-search.xml': 'https://musicbrainz.org/ws/2/artist?query={name}&limit=10',
+    'artist-lookup.xml': 'https://musicbrainz.org/ws/2/artist/{mbid}?inc=url-rels',
+}
+
+
+def _read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r') as f:
+        return f.read()
+
+
+def _body_of(document):
+    """Returns the content of the <metadata> element of a recorded response."""
+    return document[document.index('>', document.index('<metadata')) + 1:document.rindex('</metadata>')]
+
+
+class StubData:
+    """The recorded responses, rewritten per requested artist."""
+
+    def __init__(self, releases_per_artist=None):
+        self.releases = RELEASE_PATTERN.findall(_read_fixture('release-browse.xml'))
+        self.releases_per_artist = releases_per_artist or len(self.releases)
+        self.search = _body_of(_read_fixture('artist-search.xml'))
+        lookup = _body_of(_read_fixture('artist-lookup.xml'))
+        self.lookup_id = re.search(r'<artist id="([^"]+)"', lookup).group(1)
+        self.lookup = lookup
+
+    def artist_releases(self, artist_id):
+        templates = itertools.islice(itertools.cycle(self.releases), self.releases_per_artist)
+        releases = []
+        for n, template in enumerate(templates):
+            releases.append(ID_PATTERN.sub(
+                lambda m: m.group(1) + str(uuid.uuid5(uuid.NAMESPACE_URL, f"{artist_id}/{n}/{m.group(2)}")) + m.group(3),
+                template))
+        return releases
+
+    def browse_releases(self, artist_id, offset, limit):
+        releases = self.artist_releases(artist_id)
+        page = ''.join(releases[offset:offset + limit])
+        return f'<release-list count="{len(releases)}" offset="{offset}">{page}</release-list>'
+
+    def lookup_artist(self, artist_id):
+        return self.lookup.replace(self.lookup_id, artist_id)
+
+
+class RateLimiter:
+    """Allows rate requests per second on average with a burst of two, like musicbrainz.org
+    this tolerates requests arriving slightly closer together than the nominal rate."""
+
+    BURST = 2.0
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._tokens = self.BURST
+        self._updated = time.monotonic()
+
+    def allow(self):
+        if not self.rate:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.BURST, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    data = None
+    limiter = None
+    latency = 0.0
+    stats = {'requests': 0, 'rejected': 0}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.stats['requests'] += 1
+        if not self.limiter.allow():
+            self.stats['rejected'] += 1
+            self._send(503)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path[len('/ws/2/'):] if url.path.startswith('/ws/2/') else None
+        if path == 'release' and 'artist' in query:
+            body = self.data.browse_releases(query['artist'], int(query.get('offset', 0)), int(query.get('limit', 25)))
+        elif path == 'artist' and 'query' in query:
+            body = self.data.search
+        elif path and path.startswith('artist/') and MBID_PATTERN.match(path[len('artist/'):]):
+            body = self.data.lookup_artist(path[len('artist/'):])
+        else:
+            self._send(404)
+            return
+        self._send(200, f"{XML_HEADER}{METADATA_OPEN}{body}</metadata>".encode('utf-8'))
+
+
+def create_server(port=0, latency=0.0, rate=0.0, releases_per_artist=None):
+    """Creates the stub server bound to localhost, port 0 picks a free port."""
+    handler = type('Handler', (StubHandler,), {
+        'data': StubData(releases_per_artist),
+        'limiter': RateLimiter(rate),
+        'latency': latency,
+        'stats': {'requests': 0, 'rejected': 0},
+    })
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def record(artist_id, user_agent):
+    """Stores the live responses for an artist as the new fixtures."""
+    lookup = urllib.request.urlopen(urllib.request.Request(
+        RECORD_URLS['artist-lookup.xml'].format(mbid=artist_id), headers={'User-Agent': user_agent})).read()
+    name = re.search(rb'<name>([^<]+)</name>', lookup).group(1).decode('utf-8')
+    for fixture, url in RECORD_URLS.items():
+        url = url.format(mbid=artist_id, name=quote(name))
+        with urllib.request.urlopen(urllib.request.Request(url, headers={'User-Agent': user_agent})) as response:
+            data = response.read()
+        with open(os.path.join(FIXTURES_DIR, fixture), 'wb') as f:
+            f.write(data)
+        print(f"recorded {fixture} from {url}")
+        time.sleep(1)  # MusicBrainz rate limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', choices=['serve', 'record'], default='serve')
+    parser.add_argument('artist_id', nargs='?', help='artist MBID to record')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--rate', type=float, default=0.0, help='requests per second before answering 503, 0 for no limit')
+    parser.add_argument('--releases-per-artist', type=int, default=None)
+    parser.add_argument('--user-agent', default='mbz-rss-feeder-benchmarks/1 ( someone@somewhere.com )')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        if not args.artist_id:
+            parser.error('record needs an artist MBID')
+        record(args.artist_id, args.user_agent)
+        return
+
+    server = create_server(args.port, args.latency, args.rate, args.releases_per_artist)
+    print(f"MusicBrainz stub listening on 127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
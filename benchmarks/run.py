@@ -0,0 +1,182 @@
+"""Feed generation benchmarks against the local MusicBrainz stub.
+
+For every size a synthetic feeds.yml with that many artists is generated and the service
+is run in a fresh process against benchmarks.mbstub. Reported per size:
+
+- cold build: time to build every feed with empty caches (total and slowest feed)
+- warm hit: latency of serving the largest feed from the cache (median and p95)
+- requests/sec on /feed/<feed_id> and /opml, single client
+- peak memory (max RSS) of the service process
+
+    python -m benchmarks.run --sizes 1 10 100 1000 --latency 0.02 --rate 50 --json results.json
+    python -m benchmarks.run --generate 100 feeds.yml
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import yaml
+from .mbstub import create_server
+
+ARTISTS_PER_FEED = 10
+
+
+def generate_feeds(artist_count):
+    """Returns a feeds.yml structure with artist_count artists in feeds of ARTISTS_PER_FEED artists,
+    plus one feed sharing every fifth artist with the others."""
+    now = '2026-01-01T00:00:00+00:00'
+    artists = [{'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark-artist/{n}")), 'name': f"Artist {n}"}
+               for n in range(artist_count)]
+
+    def feed(n, name, members):
+        return {'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark-feed/{n}")), 'name': name,
+                'artists': members, 'created_at': now, 'updated_at': now}
+
+    feeds = [feed(n, f"Feed {n}", artists[n * ARTISTS_PER_FEED:(n + 1) * ARTISTS_PER_FEED])
+             for n in range(math.ceil(artist_count / ARTISTS_PER_FEED))]
+    feeds.append(feed(len(feeds), 'Shared', artists[::5]))
+    return {'feeds': feeds}
+
+
+def _timed_get(client, url, **kwargs):
+    start = time.perf_counter()
+    response = client.get(url, **kwargs)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return elapsed
+
+
+def _requests_per_second(client, urls, duration):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        client.get(urls[count % len(urls)])
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def run_single(args):
+    """Runs one benchmark size inside the service process, the environment is set by run_size."""
+    from mbz_rss_service import main
+    from mbz_rss_service.config import config
+
+    client = main.app.test_client()
+    feeds = config.feeds
+    feed_urls = [f"/feed/{feed['id']}" for feed in feeds]
+
+    cold = [_timed_get(client, url) for url in feed_urls]
+
+    largest = max(feeds, key=lambda feed: len(feed['artists']))
+    warm = sorted(_timed_get(client, f"/feed/{largest['id']}") for _ in range(args.warm_requests))
+
+    return {
+        'artists': args.size,
+        'feeds': len(feeds),
+        'cold_build_total_s': sum(cold),
+        'cold_build_max_s': max(cold),
+        'warm_hit_median_ms': statistics.median(warm) * 1000,
+        'warm_hit_p95_ms': warm[int(len(warm) * 0.95) - 1] * 1000,
+        'feed_rps': _requests_per_second(client, feed_urls, args.duration),
+        'opml_rps': _requests_per_second(client, ['/opml'], args.duration),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'largest_feed_bytes': len(client.get(f"/feed/{largest['id']}").data),
+    }
+
+
+def run_size(size, mb_hostname, args):
+    """Runs one benchmark size in a fresh process with its own data directory."""
+    with tempfile.TemporaryDirectory(prefix='mbz-bench-') as data_dir:
+        feeds_file = os.path.join(data_dir, 'feeds.yml')
+        config_file = os.path.join(data_dir, 'etc', 'mbz-rss-feeder.yml')
+        os.makedirs(os.path.dirname(config_file))
+        with open(feeds_file, 'w') as f:
+            yaml.dump(generate_feeds(size), f, sort_keys=False)
+        with open(config_file, 'w') as f:
+            yaml.dump({'service': {'days_back': 0, 'cache_time_hours': 8}}, f)
+
+        env = dict(os.environ,
+                   FEEDS_FILE_PATH=feeds_file,
+                   CONFIG_FILE_PATH=config_file,
+                   CACHE_DIR=os.path.join(data_dir, 'cache'),
+                   LOG_FILE=os.path.join(data_dir, 'log', 'mbz-rss-feeder.log'),
+                   LOG_LEVEL='WARNING',
+                   MB_HOSTNAME=mb_hostname,
+                   MB_HTTPS='false',
+                   MB_RATE_LIMIT=str(args.rate),
+                   BACKGROUND_REFRESH='false')
+        command = [sys.executable, '-m', 'benchmarks.run', '--single', str(size),
+                   '--duration', str(args.duration), '--warm-requests', str(args.warm_requests)]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+
+def print_table(results):
+    columns = [
+        ('artists', 'artists', '{:d}'),
+        ('feeds', 'feeds', '{:d}'),
+        ('cold_build_total_s', 'cold total s', '{:.2f}'),
+        ('cold_build_max_s', 'cold max s', '{:.2f}'),
+        ('warm_hit_median_ms', 'warm p50 ms', '{:.2f}'),
+        ('warm_hit_p95_ms', 'warm p95 ms', '{:.2f}'),
+        ('feed_rps', 'feed req/s', '{:.0f}'),
+        ('opml_rps', 'opml req/s', '{:.0f}'),
+        ('peak_rss_mb', 'peak MB', '{:.1f}'),
+    ]
+    rows = [[title for _, title, _ in columns]]
+    rows += [[fmt.format(result[key]) for key, _, fmt in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help='artist counts to benchmark')
+    parser.add_argument('--latency', type=float, default=0.02, help='stub response latency in seconds')
+    parser.add_argument('--rate', type=float, default=50, help='MusicBrainz requests per second for stub and service')
+    parser.add_argument('--releases-per-artist', type=int, default=None)
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds per requests/sec measurement')
+    parser.add_argument('--warm-requests', type=int, default=200)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--generate', nargs=2, metavar=('ARTISTS', 'FILE'), help='only write a synthetic feeds.yml')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        with open(args.generate[1], 'w') as f:
+            yaml.dump(generate_feeds(int(args.generate[0])), f, sort_keys=False)
+        return
+
+    if args.single is not None:
+        args.size = args.single
+        print(json.dumps(run_single(args)))
+        return
+
+    server = create_server(latency=args.latency, rate=args.rate, releases_per_artist=args.releases_per_artist)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    mb_hostname = f"127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    for size in args.sizes:
+        print(f"benchmarking {size} artists ...", file=sys.stderr, flush=True)
+        results.append(run_size(size, mb_hostname, args))
+    print_table(results)
+    print(f"stub: {server.RequestHandlerClass.stats['requests']} requests, "
+          f"{server.RequestHandlerClass.stats['rejected']} rejected with 503")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import sys
+import time
+from .config import config
+from . import mbdump
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+
+def import_yaml(args):
+    """Replaces the feeds in the configured storage with the feeds of a YAML file."""
+    feeds_data = storage.load_yaml(args.file)
+    config.replace_feeds(feeds_data)
+    feeds = feeds_data.get('feeds', [])
+    print(f"Imported {len(feeds)} feeds with {sum(len(f.get('artists', [])) for f in feeds)} artists "
+          f"from {args.file} into {config.STORAGE_BACKEND} storage")
+
+
+def export_yaml(args):
+    """Writes the feeds of the configured storage to a YAML file."""
+    storage.save_yaml({'feeds': config.feeds}, args.file)
+    print(f"Exported {len(config.feeds)} feeds from {config.STORAGE_BACKEND} storage to {args.file}")
+
+
+def build(args):
+    """Fetches the artists of all (or the given) feeds once and writes every feed to the cache."""
+    from . import main as service
+    service.create_app()
+    feeds = config.feeds
+    if args.feed_ids:
+        feeds = [feed for feed in feeds if feed['id'] in args.feed_ids]
+        unknown = set(args.feed_ids) - {feed['id'] for feed in feeds}
+        if unknown:
+            print(f"Unknown feeds: {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 1
+
+    report = service.prebuild_feeds(feeds)
+    print(f"Fetched {report['artists']} artists in {report['fetch_seconds']:.1f}s "
+          f"({report['failed_artists']} failed)")
+    errors = 0
+    for result in report['feeds']:
+        if 'error' in result:
+            errors += 1
+            print(f"  {result['name']} ({result['id']}): failed after {result['seconds']:.2f}s: {result['error']}")
+        else:
+            partial = ', partial' if result['partial'] else ''
+            print(f"  {result['name']} ({result['id']}): {result['items']} items, {result['size']} bytes "
+                  f"in {result['seconds']:.2f}s{partial}")
+    print(f"Built {len(feeds) - errors} of {len(feeds)} feeds in {report['total_seconds']:.1f}s")
+    return 1 if errors else 0
+
+
+def import_dump(args):
+    """Imports MusicBrainz JSON dump files into the local dump database."""
+    start = time.monotonic()
+    counts = mbdump.import_dump(args.files, args.db)
+    print(f"Imported {counts['artist']} artists and {counts['release']} releases into {args.db} "
+          f"in {time.monotonic() - start:.1f}s ({counts['skipped']} other records skipped)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mbz_rss_service', description='mbz-rss-feeder maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('import-yaml', help='import a feeds.yml into the configured storage')
+    command.add_argument('file', nargs='?', default=config.FEEDS_FILE_PATH)
+    command.set_defaults(func=import_yaml)
+
+    command = commands.add_parser('export-yaml', help='export the configured storage to a feeds.yml')
+    command.add_argument('file', nargs='?', default=config.FEEDS_FILE_PATH)
+    command.set_defaults(func=export_yaml)
+
+    command = commands.add_parser('build', help='fetch all artists and write every feed to the cache')
+    command.add_argument('feed_ids', nargs='*', metavar='feed_id', help='only build these feeds')
+    command.set_defaults(func=build)
+
+    command = commands.add_parser('import-dump', help='import MusicBrainz JSON dump files as a release source')
+    command.add_argument('files', nargs='+', metavar='file', help='e.g. artist.tar.xz and release.tar.xz')
+    command.add_argument('--db', default=config.MB_DUMP_DB_PATH, help='the dump database (MB_DUMP_DB_PATH)')
+    command.set_defaults(func=import_dump)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
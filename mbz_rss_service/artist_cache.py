@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import musicbrainzngs
+from .config import config
+from . import musicbrainz
+from . import housekeeping
+from . import metrics
+from .fsutil import atomic_write, file_lock
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+ARTIST_CACHE_DIR = os.path.join(config.CACHE_DIR, 'artists')
+
+# artist entries expire spread over the last STAGGER_FRACTION of the TTL, so artists
+# added at the same time do not all have to be refreshed by the same feed build
+STAGGER_FRACTION = 0.25
+
+# an artist whose last fetch failed is retried after this many seconds, its last known
+# releases are used meanwhile
+FAILURE_RETRY_SECONDS = 900
+
+_artist_fetches = SingleFlight()
+
+# artists are fetched in parallel up to the rate limit, the threads keep their MusicBrainz connection open
+_fetch_pool = ThreadPoolExecutor(max_workers=config.MB_WORKERS, thread_name_prefix='mb-fetch')
+
+
+def _get_service_setting(name, default):
+    return config.get_settings().get('service', {}).get(name, default)
+
+
+def _get_settings_ttl_hours():
+    """Returns the artist release TTL, falling back to the feed cache time."""
+    ttl = _get_service_setting('artist_cache_time_hours', None)
+    if ttl is None:
+        ttl = _get_service_setting('cache_time_hours', 24)
+    return int(ttl)
+
+
+def _get_entry_path(artist_id):
+    """Constructs the full path for an artist's release cache file."""
+    return os.path.join(ARTIST_CACHE_DIR, f"{artist_id}.json")
+
+
+def _uses_sqlite():
+    return config.STORAGE_BACKEND == 'sqlite'
+
+
+def _load_entry(artist_id):
+    """Loads a cached artist entry, returns None if missing or unreadable."""
+    if _uses_sqlite():
+        try:
+            return config.store.load_artist_entry(artist_id)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Could not read cached releases of artist {artist_id}: {e}")
+            return None
+    entry_file = _get_entry_path(artist_id)
+    if not os.path.exists(entry_file):
+        return None
+    try:
+        with open(entry_file, 'r') as f:
+            entry = json.load(f)
+        housekeeping.record_access(entry_file)
+        return entry
+    except (IOError, ValueError) as e:
+        logger.warning(f"Could not read artist cache file {entry_file}: {e}")
+        return None
+
+
+def _save_entry(artist_id, releases, full_fetched_at):
+    """Persists the releases of an artist, newest first, together with the fetch time and the
+    time all pages were last read."""
+    releases = sorted(releases, key=lambda r: r.get('date', '0000-00-00'), reverse=True)
+    entry = {
+        'artist_id': artist_id,
+        'fetched_at': datetime.now(timezone.utc).isoformat(),
+        'full_fetched_at': full_fetched_at,
+        'releases': releases,
+    }
+    _write_entry(entry)
+    return entry
+
+
+def _write_entry(entry):
+    artist_id = entry['artist_id']
+    if _uses_sqlite():
+        try:
+            config.store.save_artist_entry(entry)
+            logger.debug(f"Cached {len(entry['releases'])} releases for artist {artist_id} in SQLite")
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cache releases of artist {artist_id}: {e}")
+        return
+    entry_file = _get_entry_path(artist_id)
+    try:
+        atomic_write(entry_file, json.dumps(entry))
+        logger.debug(f"Cached {len(entry['releases'])} releases for artist {artist_id} at {entry_file}")
+    except IOError as e:
+        logger.warning(f"Could not write artist cache file {entry_file}: {e}")
+
+
+def _is_entry_fetched(entry):
+    """Determines if an artist entry holds fetched releases, unlike a failure-only entry."""
+    return bool(entry and entry.get('fetched_at'))
+
+
+def _save_failure(artist_id, entry, error):
+    """Records a failed fetch, keeping the last known good releases of the artist.
+
+    The failure is persisted with the entry, so no worker retries the artist before
+    FAILURE_RETRY_SECONDS. Without fetched releases a failure-only entry without releases
+    is persisted, so the retry is held back all the same."""
+    failed_at = datetime.now(timezone.utc).isoformat()
+    if not _is_entry_fetched(entry):
+        logger.warning(f"Could not fetch releases of artist {artist_id}: {error}")
+        entry = {'artist_id': artist_id, 'fetched_at': None, 'failed_at': failed_at, 'releases': []}
+    else:
+        logger.warning(f"Could not refresh releases of artist {artist_id}, "
+                       f"using the releases fetched at {entry['fetched_at']}: {error}")
+        entry = dict(entry, failed_at=failed_at)
+    _write_entry(entry)
+    return entry
+
+
+def is_entry_failed(entry):
+    """Determines if the last fetch of an artist entry failed."""
+    if not entry or not entry.get('failed_at'):
+        return False
+    return not entry.get('fetched_at') or entry['failed_at'] > entry['fetched_at']
+
+
+def _get_entry_ttl(artist_id, ttl_hours):
+    """Returns the TTL of an artist entry, shortened by a stable per-artist offset."""
+    offset = (zlib.crc32(artist_id.encode()) % 1000) / 1000
+    return timedelta(hours=ttl_hours) * (1 - STAGGER_FRACTION * offset)
+
+
+def _get_entry_age(entry):
+    if not entry or not entry.get('fetched_at'):
+        return None
+    return datetime.now(timezone.utc) - datetime.fromisoformat(entry['fetched_at'])
+
+
+def _is_entry_stale(entry, ttl_hours):
+    """Determines if a cached artist entry is older than its staggered TTL, or if its last
+    fetch failed longer than FAILURE_RETRY_SECONDS ago."""
+    if is_entry_failed(entry):
+        failed_at = datetime.fromisoformat(entry['failed_at'])
+        return datetime.now(timezone.utc) - failed_at > timedelta(seconds=FAILURE_RETRY_SECONDS)
+    age = _get_entry_age(entry)
+    if age is None:
+        return True
+    return age > _get_entry_ttl(entry['artist_id'], ttl_hours)
+
+
+def _is_full_fetch_due(entry):
+    """Determines if all release pages of an artist have to be read again.
+
+    Incremental refreshes only read the first page, changes on later pages (corrected dates,
+    a release added while another was merged) are picked up by a full fetch at least every
+    artist_full_refresh_hours."""
+    if not _is_entry_fetched(entry) or not entry.get('full_fetched_at'):
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(entry['full_fetched_at'])
+    return age > timedelta(hours=int(_get_service_setting('artist_full_refresh_hours', 168)))
+
+
+def _fetch_entry(artist_id, entry):
+    """Fetches the releases of an artist, reusing the cached entry to skip unchanged pages."""
+    known_releases = None if _is_full_fetch_due(entry) else entry['releases']
+    try:
+        releases, complete = musicbrainz.get_artist_releases(artist_id, known_releases=known_releases)
+    except musicbrainzngs.MusicBrainzError as e:
+        return _save_failure(artist_id, entry, e)
+    if known_releases is not None:
+        known_ids = {r['id'] for r in known_releases}
+        added = sum(1 for r in releases if r['id'] not in known_ids)
+        logger.debug(f"Refreshed artist {artist_id}: {added} new of {len(releases)} releases")
+    full_fetched_at = datetime.now(timezone.utc).isoformat() if complete else entry['full_fetched_at']
+    return _save_entry(artist_id, releases, full_fetched_at)
+
+
+def _get_entry_version(entry):
+    return (entry.get('fetched_at'), entry.get('failed_at')) if entry else None
+
+
+def _fetch_entry_locked(artist_id, entry):
+    seen_version = _get_entry_version(entry)
+    with file_lock(f"{_get_entry_path(artist_id)}.lock"):
+        # another worker may have refreshed the artist (or failed to) while we waited for the lock
+        current = _load_entry(artist_id)
+        if current and _get_entry_version(current) != seen_version:
+            logger.debug(f"Artist {artist_id} was refreshed concurrently")
+            return current
+        return _fetch_entry(artist_id, current)
+
+
+def _refresh_entry(artist_id, entry):
+    """Refreshes an artist entry, at most once at a time per artist across threads and workers."""
+    return _artist_fetches.do(artist_id, _fetch_entry_locked, artist_id, entry)
+
+
+def _refresh_entry_in_pool(artist_id, entry):
+    """Refreshes an artist entry in a fetch pool thread, returns it with the MusicBrainz
+    request and rate limiter durations for the timing breakdown of the calling request."""
+    with metrics.collect_timings() as timings:
+        return _refresh_entry(artist_id, entry), timings
+
+
+def get_artist_releases(artist_id):
+    """Returns the releases of an artist, fetching from MusicBrainz only if the cached entry is stale.
+
+    If the fetch fails the last known releases are returned."""
+    entry = _load_entry(artist_id)
+    if not _is_entry_stale(entry, _get_settings_ttl_hours()):
+        logger.debug(f"Using cached releases for artist {artist_id}")
+        return entry['releases']
+    return _refresh_entry(artist_id, entry)['releases']
+
+
+def get_feed_releases(artist_ids, refresh=True, refresh_budget=None):
+    """Returns the release lists (newest first) of all given artists and the ids of the
+    artists whose last fetch failed, whose lists are outdated or empty.
+
+    Artists without fetched releases are always fetched, unless their last fetch failed less
+    than FAILURE_RETRY_SECONDS ago. Stale artists are refreshed oldest
+    first, at most refresh_budget of them per call (0 refreshes all, defaults to the
+    artist_refresh_budget setting); the others are served from their cached entry and picked
+    up by a later build. Without refresh only the cached entries are used, artists without
+    one have no releases."""
+    ttl_hours = _get_settings_ttl_hours()
+    budget = int(_get_service_setting('artist_refresh_budget', 0) if refresh_budget is None else refresh_budget)
+
+    entries = {artist_id: _load_entry(artist_id) for artist_id in artist_ids}
+    if not refresh:
+        return ([entries[artist_id]['releases'] if entries[artist_id] else [] for artist_id in artist_ids],
+                [artist_id for artist_id in artist_ids if is_entry_failed(entries[artist_id])])
+    stale = [artist_id for artist_id, entry in entries.items()
+             if _is_entry_fetched(entry) and _is_entry_stale(entry, ttl_hours)]
+    stale.sort(key=lambda artist_id: _get_entry_age(entries[artist_id]), reverse=True)
+    if budget > 0:
+        if len(stale) > budget:
+            logger.debug(f"Deferring refresh of {len(stale) - budget} stale artists")
+        stale = stale[:budget]
+    stale = set(stale)
+
+    to_refresh = [artist_id for artist_id, entry in entries.items() if artist_id in stale or
+                  (not _is_entry_fetched(entry) and _is_entry_stale(entry, ttl_hours))]
+    refreshed = _fetch_pool.map(lambda artist_id: _refresh_entry_in_pool(artist_id, entries[artist_id]), to_refresh)
+    for artist_id, (entry, timings) in zip(to_refresh, refreshed):
+        entries[artist_id] = entry
+        metrics.add_timings(timings)
+
+    return ([entries[artist_id]['releases'] for artist_id in artist_ids],
+            [artist_id for artist_id in artist_ids if is_entry_failed(entries[artist_id])])
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import musicbrainzngs
+from .config import config
+from . import musicbrainz
+from .fsutil import atomic_write
+
+logger = logging.getLogger(__name__)
+
+IMPORT_DIR = os.path.join(config.CACHE_DIR, 'imports')
+
+MBID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+# an id with the URL path segment in front of it, if any, e.g. /artist/<mbid> or /release/<mbid>
+ID_IN_TEXT_PATTERN = re.compile(r'(?:([\w-]+)/)?(' + MBID_PATTERN.pattern + ')', re.IGNORECASE)
+# an artist URL, the only ids taken from OPML/RSS/Atom and JSON Feed documents
+ARTIST_URL_PATTERN = re.compile(r'/artist/(' + MBID_PATTERN.pattern + ')', re.IGNORECASE)
+
+# imports run one after another, so a large import does not take the whole rate limit
+_import_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-import')
+
+
+def _is_document(text):
+    """Determines if a text is an XML (OPML, RSS, Atom) or JSON document rather than a list."""
+    return text.lstrip()[:1] in ('<', '{')
+
+
+def extract_artist_ids(*texts):
+    """Extracts artist MBIDs from lists of ids or URLs, CSV files, or OPML/RSS/Atom/JSON Feed files.
+
+    Lists take bare ids and /artist/<mbid> URLs, ids in URLs of other entities are ignored.
+    Documents only take /artist/<mbid> URLs, as they are full of release and feed ids, e.g.
+    the guids of our own feeds. The order is kept and duplicates are dropped."""
+    artist_ids = []
+    for text in texts:
+        if _is_document(text):
+            artist_ids.extend(match.group(1).lower() for match in ARTIST_URL_PATTERN.finditer(text))
+        else:
+            artist_ids.extend(match.group(2).lower() for match in ID_IN_TEXT_PATTERN.finditer(text)
+                              if match.group(1) is None or match.group(1).lower() == 'artist')
+    return list(dict.fromkeys(artist_ids))
+
+
+def _get_job_path(job_id):
+    return os.path.join(IMPORT_DIR, f"{job_id}.json")
+
+
+def _save_job(job):
+    # jobs are kept on disk, so every worker can report the progress of an import
+    atomic_write(_get_job_path(job['id']), json.dumps(job))
+
+
+def get_job(job_id):
+    """Returns the state of an import job, or None if it is unknown."""
+    if not MBID_PATTERN.fullmatch(job_id):
+        return None
+    try:
+        with open(_get_job_path(job_id), 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def start_import(feed_id, artist_ids):
+    """Queues the import of artists into a feed and returns the job state."""
+    job = {
+        'id': str(uuid.uuid4()),
+        'feed_id': feed_id,
+        'status': 'queued',
+        'total': len(artist_ids),
+        'looked_up': 0,
+        'added': 0,
+        'skipped': 0,
+        'not_found': [],
+        'error': None,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'finished_at': None,
+    }
+    _save_job(job)
+    _import_pool.submit(_run_import, job, artist_ids)
+    logger.info(f"Queued import of {len(artist_ids)} artists into feed {feed_id} as job {job['id']}")
+    return job
+
+
+def _run_import(job, artist_ids):
+    try:
+        _import_artists(job, artist_ids)
+        job['status'] = 'done'
+    except Exception as e:
+        logger.error(f"Import job {job['id']} failed: {e}")
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    job['finished_at'] = datetime.now(timezone.utc).isoformat()
+    _save_job(job)
+
+
+def _import_artists(job, artist_ids):
+    job['status'] = 'running'
+    feed = config.get_feed(job['feed_id'])
+    if feed is None:
+        raise ValueError(f"feed {job['feed_id']} does not exist")
+
+    present = {artist['id'] for artist in feed.get('artists', [])}
+    new_ids = [artist_id for artist_id in artist_ids if artist_id not in present]
+    job['skipped'] = len(artist_ids) - len(new_ids)
+
+    # names of artists in other feeds are known, the others are looked up in batches
+    names = {artist_id: config.get_artist_name(artist_id) for artist_id in new_ids
+             if config.get_artist_name(artist_id, None)}
+    job['looked_up'] = job['skipped'] + len(names)
+    _save_job(job)
+    unknown = [artist_id for artist_id in new_ids if artist_id not in names]
+    for start in range(0, len(unknown), musicbrainz.ARTIST_LOOKUP_BATCH_SIZE):
+        batch = unknown[start:start + musicbrainz.ARTIST_LOOKUP_BATCH_SIZE]
+        try:
+            names.update(musicbrainz.lookup_artist_names(batch))
+        except musicbrainzngs.MusicBrainzError as e:
+            raise RuntimeError(f"MusicBrainz lookup failed after {start} of {len(unknown)} artists: {e}")
+        job['looked_up'] += len(batch)
+        _save_job(job)
+
+    job['not_found'] = [artist_id for artist_id in new_ids if artist_id not in names]
+    job['added'] = config.add_artists_to_feed(
+        job['feed_id'], [{'id': artist_id, 'name': names[artist_id]} for artist_id in new_ids if artist_id in names])
+    logger.info(f"Import job {job['id']} added {job['added']} artists to feed {job['feed_id']}, "
+                f"{len(job['not_found'])} not found")
@@ -1,10 +1,12 @@
 
-import shutil
 import os
-import yaml
 from datetime import datetime, timezone
 import logging
+import threading
 import uuid
+from contextlib import contextmanager
+from . import storage
+from .fsutil import file_lock
 
 logger = logging.getLogger(__name__)
 
@@ -14,35 +16,83 @@ CACHE_DIR = os.path.expandvars(os.environ.get('CACHE_DIR', '/var/mbz-rss-feeder/
 MB_APP_NAME = os.path.expandvars(os.environ.get('MB_APP_NAME', 'mbz-rss-service'))
 MB_VERSION = os.path.expandvars(os.environ.get('MB_VERSION', '1'))
 MB_CONTACT = os.path.expandvars(os.environ.get('MB_CONTACT', 'someone@somewhere.com'))
+MB_HOSTNAME = os.environ.get('MB_HOSTNAME', 'musicbrainz.org')
+MB_HTTPS = os.environ.get('MB_HTTPS', 'true').lower() in ('1', 'true', 'yes')
+MB_RATE_LIMIT = float(os.environ.get('MB_RATE_LIMIT', '1'))
+MB_RATE_BURST = float(os.environ.get('MB_RATE_BURST', '1'))
+MB_WORKERS = int(os.environ.get('MB_WORKERS', '4'))
+MB_TIMEOUT_SECONDS = float(os.environ.get('MB_TIMEOUT_SECONDS', '30'))
+MB_MAX_RETRIES = int(os.environ.get('MB_MAX_RETRIES', '5'))
+MB_BREAKER_THRESHOLD = int(os.environ.get('MB_BREAKER_THRESHOLD', '5'))
+MB_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('MB_BREAKER_COOLDOWN_SECONDS', '60'))
 MBZ_SERVICE_BASE_URL = os.path.expandvars(os.environ.get('MBZ_SERVICE_BASE_URL', 'http://mbz-rss-feeder:8080'))
+BACKGROUND_REFRESH = os.environ.get('BACKGROUND_REFRESH', 'true').lower() in ('1', 'true', 'yes')
+REFRESH_SCAN_INTERVAL_SECONDS = int(os.environ.get('REFRESH_SCAN_INTERVAL_SECONDS', '300'))
+REFRESH_SPACING_SECONDS = float(os.environ.get('REFRESH_SPACING_SECONDS', '5'))
+REFRESH_AHEAD_FRACTION = float(os.environ.get('REFRESH_AHEAD_FRACTION', '0.9'))
+SERVE_STALE = os.environ.get('SERVE_STALE', 'true').lower() in ('1', 'true', 'yes')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'yaml').lower()
+SQLITE_PATH = os.path.expandvars(os.environ.get('SQLITE_PATH', '/var/mbz-rss-feeder/mbz-rss-feeder.db'))
+FEED_MEMORY_CACHE_MB = float(os.environ.get('FEED_MEMORY_CACHE_MB', '64'))
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '1000'))
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get('SEARCH_CACHE_TTL_SECONDS', '3600'))
+HOUSEKEEPING_INTERVAL_SECONDS = int(os.environ.get('HOUSEKEEPING_INTERVAL_SECONDS', '3600'))
+RELEASE_SOURCE = os.environ.get('RELEASE_SOURCE', 'api').lower()
+MB_DUMP_DB_PATH = os.path.expandvars(os.environ.get('MB_DUMP_DB_PATH', '/var/mbz-rss-feeder/mbdump.db'))
+
+# stamp of feeds and settings that were not loaded yet, differs from every real stamp
+_NOT_LOADED = object()
+
+
+def ensure_dirs():
+    """Creates the cache and configuration directories."""
+    for dir_path in (CACHE_DIR, os.path.dirname(FEEDS_FILE_PATH), os.path.dirname(CONFIG_FILE_PATH)):
+        os.makedirs(dir_path, exist_ok=True)
 
-# file system dir check
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
-if not os.path.exists(os.path.dirname(FEEDS_FILE_PATH)):
-    os.makedirs(os.path.dirname(FEEDS_FILE_PATH))
-if not os.path.exists(os.path.dirname(CONFIG_FILE_PATH)):
-    os.makedirs(os.path.dirname(CONFIG_FILE_PATH))
 
 class Config:
+    """Feeds and settings, loaded on first use and reloaded when another process changes them."""
+
     def __init__(self):
-        self._feeds_data = self._load_yaml(FEEDS_FILE_PATH)
-        if os.path.exists(CONFIG_FILE_PATH):
-            self._settings = self._load_yaml(CONFIG_FILE_PATH)
-        else:
-            self._settings = {
-               'service': {
-                    'days_back': 0,
-                    'cache_time_hours': 8
-                }
-            }
+        self._feeds_generation = 0
+        self._lock = threading.RLock()
+        self._store = None
+        self._feeds_stamp = _NOT_LOADED
+        self._feeds_data = {}
+        self._reindex()
+        self._settings_stamp = _NOT_LOADED
+        self._settings = {}
         self.FEEDS_FILE_PATH = FEEDS_FILE_PATH
         self.CONFIG_FILE_PATH = CONFIG_FILE_PATH
         self.CACHE_DIR = CACHE_DIR
         self.MB_APP_NAME = MB_APP_NAME
         self.MB_VERSION = MB_VERSION
         self.MB_CONTACT = MB_CONTACT
+        self.MB_HOSTNAME = MB_HOSTNAME
+        self.MB_HTTPS = MB_HTTPS
+        self.MB_RATE_LIMIT = MB_RATE_LIMIT
+        self.MB_RATE_BURST = MB_RATE_BURST
+        self.MB_WORKERS = MB_WORKERS
+        self.MB_TIMEOUT_SECONDS = MB_TIMEOUT_SECONDS
+        self.MB_MAX_RETRIES = MB_MAX_RETRIES
+        self.MB_BREAKER_THRESHOLD = MB_BREAKER_THRESHOLD
+        self.MB_BREAKER_COOLDOWN_SECONDS = MB_BREAKER_COOLDOWN_SECONDS
         self.MBZ_SERVICE_BASE_URL = MBZ_SERVICE_BASE_URL
+        self.BACKGROUND_REFRESH = BACKGROUND_REFRESH
+        self.REFRESH_SCAN_INTERVAL_SECONDS = REFRESH_SCAN_INTERVAL_SECONDS
+        self.REFRESH_SPACING_SECONDS = REFRESH_SPACING_SECONDS
+        self.REFRESH_AHEAD_FRACTION = REFRESH_AHEAD_FRACTION
+        self.SERVE_STALE = SERVE_STALE
+        self.SERVER_TIMING = SERVER_TIMING
+        self.STORAGE_BACKEND = STORAGE_BACKEND
+        self.SQLITE_PATH = SQLITE_PATH
+        self.FEED_MEMORY_CACHE_MB = FEED_MEMORY_CACHE_MB
+        self.SEARCH_CACHE_SIZE = SEARCH_CACHE_SIZE
+        self.SEARCH_CACHE_TTL_SECONDS = SEARCH_CACHE_TTL_SECONDS
+        self.HOUSEKEEPING_INTERVAL_SECONDS = HOUSEKEEPING_INTERVAL_SECONDS
+        self.RELEASE_SOURCE = RELEASE_SOURCE
+        self.MB_DUMP_DB_PATH = MB_DUMP_DB_PATH
 
         try:
             with open(os.path.join(os.path.dirname(__file__), '..', 'VERSION')) as f:
@@ -51,45 +101,138 @@ class Config:
             self.VERSION = '0.0.0'
 
     def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
         if name == 'feeds':
             return self._feeds_data.get('feeds', [])
-        if name in self._settings['service']:
-            return self._settings['service'][name]
+        service = self.get_settings().get('service', {})
+        if name in service:
+            return service[name]
         raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
+    @property
+    def feeds_generation(self):
+        """A counter that changes with every change of the feeds, also by other processes."""
+        self._reload_feeds_if_changed()
+        return self._feeds_generation
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = storage.create_feed_store(STORAGE_BACKEND, FEEDS_FILE_PATH, SQLITE_PATH)
+        return self._store
+
+    def _reindex(self):
+        """Rebuilds the id lookups from the loaded feed data."""
+        self._feeds_generation += 1
+        self._feeds_by_id = {}
+        self._artist_names = {}
+        self._artist_feeds = {}
+        for feed in self._feeds_data.get('feeds', []):
+            self._feeds_by_id[feed['id']] = feed
+            for artist in feed.get('artists', []):
+                self._index_artist(feed['id'], artist)
+
+    def _index_artist(self, feed_id, artist):
+        self._artist_names.setdefault(artist['id'], artist['name'])
+        self._artist_feeds.setdefault(artist['id'], set()).add(feed_id)
+
+    def _unindex_artist(self, feed_id, artist_id):
+        feed_ids = self._artist_feeds.get(artist_id)
+        if feed_ids is None:
+            return
+        feed_ids.discard(feed_id)
+        if not feed_ids:
+            del self._artist_feeds[artist_id]
+            del self._artist_names[artist_id]
+
     def get_settings(self):
+        self._reload_settings_if_changed()
         return self._settings
 
-    def _load_yaml(self, file_path):
-        if not os.path.exists(file_path):
-            return {}
-        with open(file_path, 'r') as f:
-            return yaml.safe_load(f) or {}
+    def _load_settings(self):
+        if os.path.exists(CONFIG_FILE_PATH):
+            return storage.load_yaml(CONFIG_FILE_PATH)
+        return {
+            'service': {
+                'days_back': 0,
+                'cache_time_hours': 8
+            }
+        }
+
+    def _reload_feeds_if_changed(self):
+        """Reloads the feeds if another process changed them since they were loaded."""
+        stamp = self.store.stamp()
+        if stamp == self._feeds_stamp:
+            return
+        with self._lock:
+            if stamp == self._feeds_stamp:
+                return
+            logger.debug(f"Reloading changed feeds from {STORAGE_BACKEND} storage")
+            self._feeds_data = self.store.load()
+            self._feeds_stamp = stamp
+            self._reindex()
+
+    def _load_feeds_once(self):
+        """Loads the feeds if they were never loaded, for lookups that do not check for changes."""
+        if self._feeds_stamp is _NOT_LOADED:
+            self._reload_feeds_if_changed()
+
+    def _reload_settings_if_changed(self):
+        """Reloads the settings if another process saved them since they were loaded."""
+        stamp = storage.file_stamp(CONFIG_FILE_PATH)
+        if stamp == self._settings_stamp:
+            return
+        with self._lock:
+            if stamp != self._settings_stamp:
+                logger.debug(f"Reloading changed config file {CONFIG_FILE_PATH}")
+                self._settings = self._load_settings()
+                self._settings_stamp = stamp
+
+    @contextmanager
+    def _locked(self, file_path):
+        """Serializes a read-modify-write of a YAML file across threads and worker processes."""
+        with self._lock, file_lock(f"{file_path}.lock"):
+            yield
 
-    def _save_yaml(self, data, file_path):
-        if os.path.exists(file_path):
-            backup_path = f"{file_path}.{datetime.now().strftime('%Y%m%d%H%M%S')}.bak"
-            shutil.copy(file_path, backup_path)
+    @contextmanager
+    def _feeds_locked(self):
+        """Serializes a change of the feeds across threads, and across processes if the store needs it."""
+        with self._lock, self.store.locked():
+            self._reload_feeds_if_changed()
+            yield
 
-        logger.debug(f"Saving yaml to {file_path}")
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as f:
-            yaml.dump(data, f, default_flow_style=False, sort_keys=False)
+    def _commit(self, stamps):
+        """Takes the (previous, current) stamps of a store write.
 
-        logger.debug(f"Saved yaml to {file_path}")
+        If the store was changed by another process between our last load and the write, the
+        stamp is left behind so the next access reloads everything."""
+        previous, current = stamps
+        self._feeds_generation += 1
+        if previous == self._feeds_stamp:
+            self._feeds_stamp = current
 
     @property
     def feeds(self):
+        self._reload_feeds_if_changed()
         return self._feeds_data.get('feeds', [])
 
     def save_feeds(self):
-        self._save_yaml(self._feeds_data, FEEDS_FILE_PATH)
+        """Saves all feeds, callers hold the feeds lock (see _feeds_locked)."""
+        self._commit(self.store.save(self._feeds_data))
+
+    def replace_feeds(self, feeds_data):
+        """Replaces all feeds, e.g. when importing a feeds.yml into SQLite."""
+        with self._feeds_locked():
+            self._feeds_data = feeds_data
+            self._reindex()
+            self.save_feeds()
 
     def get_feed(self, feed_id):
-        for feed in self.feeds:
-            if feed['id'] == feed_id:
-                return feed
-        return None
+        self._reload_feeds_if_changed()
+        return self._feeds_by_id.get(feed_id)
 
     def add_feed(self, name):
         now = datetime.now(timezone.utc).isoformat()
@@ -100,57 +243,103 @@ class Config:
             'created_at': now,
             'updated_at': now
         }
-        if 'feeds' not in self._feeds_data:
-            self._feeds_data['feeds'] = []
-        self._feeds_data['feeds'].append(new_feed)
-        self.save_feeds()
+        with self._feeds_locked():
+            if 'feeds' not in self._feeds_data:
+                self._feeds_data['feeds'] = []
+            self._feeds_data['feeds'].append(new_feed)
+            self._feeds_by_id[new_feed['id']] = new_feed
+            self._commit(self.store.add_feed(self._feeds_data, new_feed))
         return new_feed
 
     def delete_feed(self, feed_id):
-        if 'feeds' in self._feeds_data:
-            self._feeds_data['feeds'] = [feed for feed in self.feeds if feed['id'] != feed_id]
-            self.save_feeds()
+        with self._feeds_locked():
+            feed = self._feeds_by_id.pop(feed_id, None)
+            if feed is not None:
+                self._feeds_data['feeds'] = [f for f in self._feeds_data.get('feeds', []) if f['id'] != feed_id]
+                for artist in feed.get('artists', []):
+                    self._unindex_artist(feed_id, artist['id'])
+                self._commit(self.store.delete_feed(self._feeds_data, feed_id))
 
     def add_artist_to_feed(self, feed_id, artist_id, artist_name, links = None):
-        for feed in self.feeds:
-            if feed['id'] == feed_id:
-                if 'artists' not in feed:
-                    feed['artists'] = []
-                if not any(a['id'] == artist_id for a in feed['artists']):
-                    artist_data = {'id': artist_id, 'name': artist_name}
-                    if links:
-                        artist_data['links'] = links
-                    feed['artists'].append(artist_data)
-                    feed['updated_at'] = datetime.now(timezone.utc).isoformat()
-                    self.save_feeds()
-                break
+        with self._feeds_locked():
+            feed = self._feeds_by_id.get(feed_id)
+            if feed is None:
+                return
+            if 'artists' not in feed:
+                feed['artists'] = []
+            if feed_id not in self._artist_feeds.get(artist_id, ()):
+                artist_data = {'id': artist_id, 'name': artist_name}
+                if links:
+                    artist_data['links'] = links
+                feed['artists'].append(artist_data)
+                self._index_artist(feed_id, artist_data)
+                feed['updated_at'] = datetime.now(timezone.utc).isoformat()
+                self._commit(self.store.add_artist(self._feeds_data, feed, artist_data))
+
+    def add_artists_to_feed(self, feed_id, artists):
+        """Adds several artists to a feed with a single save, returns the number of added artists."""
+        with self._feeds_locked():
+            feed = self._feeds_by_id.get(feed_id)
+            if feed is None:
+                return 0
+            if 'artists' not in feed:
+                feed['artists'] = []
+            added = []
+            for artist in artists:
+                if feed_id not in self._artist_feeds.get(artist['id'], ()):
+                    feed['artists'].append(artist)
+                    self._index_artist(feed_id, artist)
+                    added.append(artist)
+            if added:
+                feed['updated_at'] = datetime.now(timezone.utc).isoformat()
+                self._commit(self.store.add_artists(self._feeds_data, feed, added))
+            return len(added)
 
     def remove_artist_from_feed(self, feed_id, artist_id):
-        for feed in self.feeds:
-            if feed['id'] == feed_id and 'artists' in feed:
-                original_artist_count = len(feed['artists'])
+        with self._feeds_locked():
+            feed = self._feeds_by_id.get(feed_id)
+            if feed is None or 'artists' not in feed:
+                return
+            if feed_id in self._artist_feeds.get(artist_id, ()):
                 feed['artists'] = [a for a in feed['artists'] if a['id'] != artist_id]
-                if len(feed['artists']) < original_artist_count:
-                    feed['updated_at'] = datetime.now(timezone.utc).isoformat()
-                    self.save_feeds()
-                break
+                self._unindex_artist(feed_id, artist_id)
+                feed['updated_at'] = datetime.now(timezone.utc).isoformat()
+                self._commit(self.store.remove_artist(self._feeds_data, feed, artist_id))
 
-    def get_artist_name(self, artist_id):
-        for feed in self.feeds:
-            for artist in feed.get('artists', []):
-                if artist['id'] == artist_id:
-                    return artist['name']
-        return 'unknown artist'
+    def get_artist_ids(self):
+        """Returns the ids of all artists that are part of any feed."""
+        self._reload_feeds_if_changed()
+        return set(self._artist_feeds)
+
+    def search_artists(self, query, limit=10):
+        """Finds artists of any feed whose name contains every word of the query."""
+        self._load_feeds_once()
+        words = query.casefold().split()
+        found = []
+        for artist_id, name in list(self._artist_names.items()):
+            folded = name.casefold()
+            if words and all(word in folded for word in words):
+                found.append({'id': artist_id, 'name': name, 'disambiguation': ''})
+                if len(found) >= limit:
+                    break
+        return found
+
+    def get_artist_name(self, artist_id, default='unknown artist'):
+        self._load_feeds_once()
+        return self._artist_names.get(artist_id, default)
 
     def save_settings(self, days_back, cache_time_hours):
         logger.debug(f"Saving settings: days_back={days_back}, cache_time_hours={cache_time_hours}")
-        if 'service' not in self._settings:
-            self._settings['service'] = {}
-        if days_back is not None:
-            self._settings['service']['days_back'] = int(days_back)
-        if cache_time_hours is not None:
-            self._settings['service']['cache_time_hours'] = int(cache_time_hours)
-        self._save_yaml(self._settings, CONFIG_FILE_PATH)
+        with self._locked(CONFIG_FILE_PATH):
+            self._reload_settings_if_changed()
+            if 'service' not in self._settings:
+                self._settings['service'] = {}
+            if days_back is not None:
+                self._settings['service']['days_back'] = int(days_back)
+            if cache_time_hours is not None:
+                self._settings['service']['cache_time_hours'] = int(cache_time_hours)
+            storage.save_yaml(self._settings, CONFIG_FILE_PATH)
+            self._settings_stamp = storage.file_stamp(CONFIG_FILE_PATH)
 
 # Global instance
 config = Config()
@@ -0,0 +1,253 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from .config import config
+from . import metrics
+from .fsutil import atomic_write, atomic_writer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# (feed_id, format) -> (sidecar mtime, metadata) of the cached feeds seen by this process
+_meta_index = {}
+
+# cache file extension of every feed format, each format is built and cached on its own
+FORMAT_EXTENSIONS = {'rss': 'xml', 'atom': 'atom', 'json': 'json'}
+
+# rendered chunks are buffered up to this size before they are written and compressed
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# content encodings stored next to the plain cache file, in order of preference
+ENCODINGS = {'gzip': '.gz'}
+if brotli is not None:
+    ENCODINGS = {'br': '.br', **ENCODINGS}
+
+
+class MemoryCache:
+    """A byte-bounded LRU of cached feed files keyed by (feed_id, format, encoding).
+
+    Entries are tagged with the etag of the build they belong to, so a rebuild in this or
+    another worker (a new etag in the metadata) invalidates them."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != etag:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (etag, data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+            metrics.feed_memory_cache_bytes.set(self._size)
+
+    def discard_feed(self, feed_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == feed_id]:
+                self._pop(key)
+            metrics.feed_memory_cache_bytes.set(self._size)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+_memory_cache = MemoryCache(int(config.FEED_MEMORY_CACHE_MB * 1024 * 1024))
+
+
+def get_cache_file_path(feed_id, feed_format='rss'):
+    """Constructs the full path for a feed's cache file."""
+    return os.path.join(config.CACHE_DIR, f"{feed_id}.{FORMAT_EXTENSIONS[feed_format]}")
+
+
+def get_meta_file_path(feed_id, feed_format='rss'):
+    """Constructs the full path for the metadata sidecar of a feed's cache file."""
+    if feed_format == 'rss':
+        return os.path.join(config.CACHE_DIR, f"{feed_id}.meta.json")
+    return os.path.join(config.CACHE_DIR, f"{feed_id}.{FORMAT_EXTENSIONS[feed_format]}.meta.json")
+
+
+def get_variant_path(cache_file, encoding):
+    """Returns the path of a compressed variant of a cache file, or the file itself without encoding."""
+    if encoding is None:
+        return cache_file
+    return cache_file + ENCODINGS[encoding]
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=9)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_variants(data):
+    """Returns all compressed variants of data keyed by encoding."""
+    return {encoding: compress(data, encoding) for encoding in ENCODINGS}
+
+
+def _create_compressor(encoding):
+    """Returns the (compress, flush) functions of a streaming compressor for an encoding."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=9)
+        return compressor.process, compressor.finish
+    # wbits 31 writes a gzip container, with mtime 0 like compress()
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _buffer_chunks(chunks):
+    """Joins the small str chunks of a template stream into UTF-8 blocks of WRITE_BUFFER_SIZE."""
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= WRITE_BUFFER_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def write_feed(feed_id, chunks, feed_data, get_item_count, failed_artists=0, feed_format='rss'):
+    """Atomically writes a rendered feed, its compressed variants and its metadata to the cache.
+
+    The feed is consumed from an iterable of str chunks and compressed while it is written,
+    so it is never held in memory as a whole. get_item_count is called once the chunks are
+    consumed. A build with failed_artists is marked as partial in the metadata.
+
+    The variants are renamed into place before the plain file and the metadata sidecar is
+    written last, so the metadata never describes a build whose files are not in place yet."""
+    cache_file = get_cache_file_path(feed_id, feed_format)
+    compressors = {encoding: _create_compressor(encoding) for encoding in ENCODINGS}
+    variant_sizes = dict.fromkeys(ENCODINGS, 0)
+    digest = hashlib.sha1()
+    size = 0
+    with ExitStack() as files:
+        plain_file = files.enter_context(atomic_writer(cache_file))
+        variant_files = {encoding: files.enter_context(atomic_writer(get_variant_path(cache_file, encoding)))
+                         for encoding in ENCODINGS}
+        for data in _buffer_chunks(chunks):
+            plain_file.write(data)
+            digest.update(data)
+            size += len(data)
+            for encoding, (compress_chunk, _) in compressors.items():
+                compressed = compress_chunk(data)
+                variant_files[encoding].write(compressed)
+                variant_sizes[encoding] += len(compressed)
+        for encoding, (_, flush) in compressors.items():
+            compressed = flush()
+            variant_files[encoding].write(compressed)
+            variant_sizes[encoding] += len(compressed)
+
+    meta = {
+        'feed_id': feed_id,
+        'format': feed_format,
+        'build_time': datetime.now(timezone.utc).isoformat(),
+        'feed_updated_at': feed_data.get('updated_at'),
+        'size': size,
+        'etag': digest.hexdigest(),
+        'item_count': get_item_count(),
+        'variants': variant_sizes,
+        'partial': failed_artists > 0,
+        'failed_artists': failed_artists,
+    }
+    meta_file = get_meta_file_path(feed_id, feed_format)
+    atomic_write(meta_file, json.dumps(meta))
+    _meta_index[(feed_id, feed_format)] = (os.stat(meta_file).st_mtime_ns, meta)
+    return cache_file
+
+
+def get_meta(feed_id, feed_format='rss'):
+    """Returns the metadata of a feed's cached build, or None if the feed is not cached.
+
+    The metadata is kept in memory and only re-read when the sidecar was replaced, e.g.
+    by a build in another worker."""
+    meta_file = get_meta_file_path(feed_id, feed_format)
+    key = (feed_id, feed_format)
+    try:
+        mtime = os.stat(meta_file).st_mtime_ns
+    except OSError:
+        _meta_index.pop(key, None)
+        return None
+
+    indexed = _meta_index.get(key)
+    if indexed and indexed[0] == mtime:
+        return indexed[1]
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+    except (IOError, ValueError) as e:
+        logger.warning(f"Could not read cache metadata {meta_file}: {e}")
+        return None
+    _meta_index[key] = (mtime, meta)
+    return meta
+
+
+def forget_meta(feed_id):
+    """Drops the in-memory metadata and content of a feed whose cache files were removed."""
+    for feed_format in FORMAT_EXTENSIONS:
+        _meta_index.pop((feed_id, feed_format), None)
+    _memory_cache.discard_feed(feed_id)
+
+
+def read_feed(feed_id, meta, encoding=None, feed_format='rss'):
+    """Returns the bytes of a cached feed (variant) from memory, reading it from disk on a miss.
+
+    Returns None if the memory cache is disabled or the feed is too large for it, the file is
+    then best streamed from disk."""
+    size = meta['size'] if encoding is None else meta['variants'][encoding]
+    if size > _memory_cache.max_bytes:
+        return None
+    key = (feed_id, feed_format, encoding)
+    data = _memory_cache.get(key, meta['etag'])
+    if data is not None:
+        metrics.feed_memory_cache_requests.inc(result='hit')
+        return data
+    metrics.feed_memory_cache_requests.inc(result='miss')
+    with open(get_variant_path(get_cache_file_path(feed_id, feed_format), encoding), 'rb') as f:
+        data = f.read()
+    _memory_cache.put(key, meta['etag'], data)
+    return data
+
+
+def get_build_time(meta):
+    """Returns the build time of a cached feed as a timezone-aware datetime, or None."""
+    if not meta:
+        return None
+    return datetime.fromisoformat(meta['build_time'])
+
+
+def choose_encoding(accept_encodings):
+    """Picks the preferred stored encoding accepted by the client, None for the plain file."""
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
@@ -0,0 +1,47 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, locking is then limited to a single process
+    fcntl = None
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Holds an exclusive advisory lock on lock_path, shared by all threads and processes."""
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_writer(file_path, mode='wb'):
+    """Yields a temporary file next to file_path that is renamed into place when the block
+    completes, so readers see either the previous or the complete new file."""
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(file_path, data):
+    """Atomically replaces file_path with str or bytes data, see atomic_writer."""
+    with atomic_writer(file_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
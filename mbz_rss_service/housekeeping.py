@@ -0,0 +1,281 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from .config import config
+from . import feed_cache
+from .fsutil import atomic_write
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = os.path.join(config.CACHE_DIR, 'housekeeping.json')
+
+# access times are only updated once per ACCESS_RESOLUTION_SECONDS per file and process
+ACCESS_RESOLUTION_SECONDS = 600
+
+# temporary files of interrupted atomic writes are removed once they are this old
+TEMP_FILE_GRACE_SECONDS = 3600
+
+# the progress of finished bulk imports is kept for a week
+IMPORT_JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+BACKUP_PATTERN = re.compile(r'\.(\d{14})\.bak(\.gz)?$')
+_FEED_EXTENSIONS = '|'.join(feed_cache.FORMAT_EXTENSIONS.values())
+FEED_CACHE_PATTERN = re.compile(
+    rf'^([0-9a-f-]{{36}})\.(?:(?:{_FEED_EXTENSIONS})(?:\.gz|\.br)?|(?:(?:{_FEED_EXTENSIONS})\.)?meta\.json)$')
+
+_last_access = {}
+_thread = None
+
+
+def _get_service_setting(name, default):
+    return config.get_settings().get('service', {}).get(name, default)
+
+
+def record_access(file_path):
+    """Marks a cache file as used by setting its access time, which orders the LRU eviction.
+
+    The access time is set explicitly, so it does not depend on noatime/relatime mounts."""
+    now = time.time()
+    if now - _last_access.get(file_path, 0) < ACCESS_RESOLUTION_SECONDS:
+        return
+    _last_access[file_path] = now
+    try:
+        os.utime(file_path, ns=(time.time_ns(), os.stat(file_path).st_mtime_ns))
+    except OSError:
+        pass
+
+
+def _remove(file_path):
+    try:
+        size = os.path.getsize(file_path)
+        os.unlink(file_path)
+        return size
+    except OSError:
+        return 0
+
+
+def remove_feed_files(feed_id):
+    """Removes the cached builds of a feed in all formats with their variants and metadata.
+
+    The lock files are left in place, a build in another worker may be holding them."""
+    removed = 0
+    for feed_format in feed_cache.FORMAT_EXTENSIONS:
+        cache_file = feed_cache.get_cache_file_path(feed_id, feed_format)
+        for file_path in [cache_file, feed_cache.get_meta_file_path(feed_id, feed_format)] + \
+                [feed_cache.get_variant_path(cache_file, encoding) for encoding in feed_cache.ENCODINGS]:
+            removed += _remove(file_path)
+    feed_cache.forget_meta(feed_id)
+    return removed
+
+
+def _list_backups(file_path):
+    """Returns the backups of a YAML file as (timestamp, path), newest first."""
+    backups = []
+    for backup in glob.glob(f"{glob.escape(file_path)}.*.bak*"):
+        match = BACKUP_PATTERN.search(backup)
+        if match:
+            backups.append((datetime.strptime(match.group(1), '%Y%m%d%H%M%S'), backup))
+    return sorted(backups, reverse=True)
+
+
+def rotate_backups(file_path, keep_count, max_age_days, compress):
+    """Deletes backups beyond the newest keep_count or older than max_age_days (0 disables either
+    limit) and gzips the remaining ones except the newest, returns counts for the report."""
+    report = {'deleted': 0, 'compressed': 0, 'kept': 0, 'bytes': 0}
+    now = datetime.now()
+    for index, (timestamp, backup) in enumerate(_list_backups(file_path)):
+        if (keep_count and index >= keep_count) or (max_age_days and (now - timestamp).days >= max_age_days):
+            _remove(backup)
+            report['deleted'] += 1
+            continue
+        if compress and index > 0 and not backup.endswith('.gz'):
+            with open(backup, 'rb') as f:
+                atomic_write(f"{backup}.gz", gzip.compress(f.read()))
+            os.unlink(backup)
+            backup = f"{backup}.gz"
+            report['compressed'] += 1
+        report['kept'] += 1
+        report['bytes'] += os.path.getsize(backup)
+    return report
+
+
+def _collect_cache_entries():
+    """Groups the cache files by feed and artist, returns {(kind, id): [paths]}.
+
+    Lock files are not part of an entry, they are only removed with orphaned entries."""
+    entries = {}
+    for name in os.listdir(config.CACHE_DIR):
+        match = FEED_CACHE_PATTERN.match(name)
+        if match:
+            entries.setdefault(('feed', match.group(1)), []).append(os.path.join(config.CACHE_DIR, name))
+    artist_dir = os.path.join(config.CACHE_DIR, 'artists')
+    if os.path.isdir(artist_dir):
+        for name in os.listdir(artist_dir):
+            if name.endswith('.json'):
+                artist_id = name.split('.', 1)[0]
+                entries.setdefault(('artist', artist_id), []).append(os.path.join(artist_dir, name))
+    return entries
+
+
+def _remove_entry(kind, entry_id, paths):
+    if kind == 'feed':
+        return remove_feed_files(entry_id)
+    return sum(_remove(path) for path in paths)
+
+
+def _load_configured_ids():
+    """Returns the ids of the configured feeds and artists, or None if they are not safe to use.
+
+    A missing feeds.yml reads as no feeds, and an unreadable store would look the same, so an
+    empty configuration is never taken as a reason to remove every cached feed and artist."""
+    try:
+        feed_ids = {feed['id'] for feed in config.feeds}
+        artist_ids = config.get_artist_ids()
+    except Exception as e:
+        logger.warning(f"Skipping orphan removal, the feeds could not be read: {e}")
+        return None
+    if not feed_ids:
+        logger.warning("Skipping orphan removal, no feeds are configured")
+        return None
+    return feed_ids, artist_ids
+
+
+def remove_orphans(entries):
+    """Removes cached feeds and artists that are no longer configured, and stale temporary files."""
+    report = {'feeds': 0, 'artists': 0, 'temp_files': 0, 'import_jobs': 0, 'skipped': False}
+    configured = _load_configured_ids()
+    if configured is None:
+        report['skipped'] = True
+    else:
+        _remove_unconfigured(entries, *configured, report)
+    _remove_stale_files(report)
+    return report
+
+
+def _remove_unconfigured(entries, feed_ids, artist_ids, report):
+    for (kind, entry_id), paths in list(entries.items()):
+        if entry_id in (feed_ids if kind == 'feed' else artist_ids):
+            continue
+        _remove_entry(kind, entry_id, paths)
+        del entries[(kind, entry_id)]
+        report[f"{kind}s"] += 1
+    for extension in feed_cache.FORMAT_EXTENSIONS.values():
+        for lock_file in glob.glob(os.path.join(glob.escape(config.CACHE_DIR), f"*.{extension}.lock")):
+            if os.path.basename(lock_file).split('.', 1)[0] not in feed_ids:
+                _remove(lock_file)
+    for lock_file in glob.glob(os.path.join(glob.escape(config.CACHE_DIR), 'artists', '*.json.lock')):
+        if os.path.basename(lock_file).split('.', 1)[0] not in artist_ids:
+            _remove(lock_file)
+    if config.STORAGE_BACKEND == 'sqlite':
+        report['artists'] += config.store.delete_artist_entries_except(artist_ids)
+
+
+def _remove_stale_files(report):
+    cutoff = time.time() - TEMP_FILE_GRACE_SECONDS
+    for temp_file in glob.glob(os.path.join(glob.escape(config.CACHE_DIR), '**', '.*.tmp'), recursive=True):
+        try:
+            if os.stat(temp_file).st_mtime < cutoff:
+                _remove(temp_file)
+                report['temp_files'] += 1
+        except OSError:
+            pass
+
+    cutoff = time.time() - IMPORT_JOB_RETENTION_SECONDS
+    for job_file in glob.glob(os.path.join(glob.escape(config.CACHE_DIR), 'imports', '*.json')):
+        try:
+            if os.stat(job_file).st_mtime < cutoff:
+                _remove(job_file)
+                report['import_jobs'] += 1
+        except OSError:
+            pass
+
+
+def evict_cache(entries, max_bytes):
+    """Evicts the least recently used feeds and artists until the cache fits into max_bytes."""
+    report = {'evicted_feeds': 0, 'evicted_artists': 0, 'bytes': 0, 'files': 0, 'max_bytes': max_bytes}
+    sized = []
+    for key, paths in entries.items():
+        size, last_access = 0, 0
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size += stat.st_size
+            last_access = max(last_access, stat.st_atime, stat.st_mtime)
+        sized.append((last_access, size, key, paths))
+        report['bytes'] += size
+        report['files'] += len(paths)
+
+    if max_bytes:
+        for last_access, size, (kind, entry_id), paths in sorted(sized):
+            if report['bytes'] <= max_bytes:
+                break
+            logger.debug(f"Evicting cached {kind} {entry_id} ({size} bytes)")
+            _remove_entry(kind, entry_id, paths)
+            report['bytes'] -= size
+            report['files'] -= len(paths)
+            report[f"evicted_{kind}s"] += 1
+    return report
+
+
+def run():
+    """Runs all housekeeping tasks once and stores the report for the settings page."""
+    start = time.monotonic()
+    keep_count = int(_get_service_setting('backup_keep_count', 10))
+    max_age_days = int(_get_service_setting('backup_max_age_days', 30))
+    compress = bool(_get_service_setting('backup_compress', False))
+    entries = _collect_cache_entries()
+    report = {
+        'run_at': datetime.now(timezone.utc).isoformat(),
+        'backups': {os.path.basename(path): rotate_backups(path, keep_count, max_age_days, compress)
+                    for path in (config.FEEDS_FILE_PATH, config.CONFIG_FILE_PATH)},
+        'orphans': remove_orphans(entries),
+        'cache': evict_cache(entries, int(_get_service_setting('cache_max_mb', 0)) * 1024 * 1024),
+    }
+    report['duration_seconds'] = round(time.monotonic() - start, 3)
+    atomic_write(REPORT_FILE, json.dumps(report))
+    logger.info(f"Housekeeping done in {report['duration_seconds']}s: {report['orphans']}, cache {report['cache']}")
+    return report
+
+
+def get_report():
+    """Returns the report of the last housekeeping run of any worker, or None."""
+    try:
+        with open(REPORT_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _is_due(interval_seconds):
+    try:
+        return time.time() - os.stat(REPORT_FILE).st_mtime >= interval_seconds
+    except OSError:
+        return True
+
+
+def _run_periodically(interval_seconds):
+    while True:
+        # all workers run this loop, the report file tells them if another worker already ran
+        if _is_due(interval_seconds):
+            try:
+                run()
+            except Exception as e:
+                logger.error(f"Housekeeping failed: {e}")
+        time.sleep(interval_seconds)
+
+
+def start(interval_seconds):
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_run_periodically, args=(interval_seconds,), name='housekeeping', daemon=True)
+    _thread.start()
+    logger.info(f"Started housekeeping (every {interval_seconds}s)")
@@ -1,16 +1,46 @@
 
-from .config import config
+from .config import config, ensure_dirs
 import logging
-from flask import Flask, jsonify, render_template, request, redirect, url_for
+from flask import Flask, Response, g, jsonify, make_response, render_template, request, redirect, send_file, stream_template, url_for
 from datetime import datetime, timedelta, timezone
-from email.utils import formatdate, parsedate_to_datetime
-import xml.etree.ElementTree as ET
+from email.utils import formatdate
+import hashlib
+import itertools
+import json
+import math
 import os
 import sys
+import threading
+import time
+from . import metrics
 from . import musicbrainz
+from . import feed_cache
+from . import artist_cache
+from . import housekeeping
+from . import bulk_import
+from . import models
+from .scheduler import FeedRefreshScheduler
+from .fsutil import file_lock
+from .singleflight import SingleFlight
 
 XML_CONTENT_TYPE = "application/xml"
 
+# template and content type by feed format, the format is chosen by a suffix or the Accept header
+FEED_FORMATS = {
+    'rss': ('feed.xml', XML_CONTENT_TYPE),
+    'atom': ('feed.atom.xml', 'application/atom+xml'),
+    'json': ('feed.json', 'application/feed+json'),
+}
+# media types accepted for feeds without a format suffix, in order of preference
+FORMAT_MEDIA_TYPES = {
+    'application/rss+xml': 'rss',
+    'application/xml': 'rss',
+    'text/xml': 'rss',
+    'application/atom+xml': 'atom',
+    'application/feed+json': 'json',
+    'application/json': 'json',
+}
+
 log_level_str = os.environ.get('LOG_LEVEL', 'INFO').upper()
 log_level = getattr(logging, log_level_str, logging.INFO)
 log_file = os.path.expandvars(os.environ.get('LOG_FILE', '/var/mbz-rss-feeder/log/mbz-rss-feeder.log'))
@@ -18,63 +48,104 @@ log_format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 mbz_log_level_str = os.environ.get('MBZ_LOG_LEVEL', 'WARNING').upper()
 mbz_log_level = getattr(logging, mbz_log_level_str, logging.WARNING)
 
-# file system init
-if not os.path.exists(os.path.dirname(log_file)):
-    os.makedirs(os.path.dirname(log_file))
-if not os.path.exists(os.path.dirname(config.CACHE_DIR)):
-    os.makedirs(os.path.dirname(config.CACHE_DIR))
-
-
-# Configure root logger
-root_logger = logging.getLogger()
-root_logger.setLevel(log_level)
-formatter = logging.Formatter(log_format)
-
-# configure musicbrainz logger
-logging.getLogger('musicbrainzngs').setLevel(mbz_log_level)
-
-# Clear existing handlers
-if root_logger.hasHandlers():
-    root_logger.handlers.clear()
+logger = logging.getLogger(__name__)
 
-# Add file handler
-file_handler = logging.FileHandler(log_file)
-file_handler.setFormatter(formatter)
-root_logger.addHandler(file_handler)
+# the app of this process, set by create_app
+_app = None
+_routes = []
+_background_pid = None
+_background_lock = threading.Lock()
+
+
+def _configure_logging():
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+    # Configure root logger
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    formatter = logging.Formatter(log_format)
+
+    # configure musicbrainz logger
+    logging.getLogger('musicbrainzngs').setLevel(mbz_log_level)
+
+    # Clear existing handlers
+    if root_logger.hasHandlers():
+        root_logger.handlers.clear()
+
+    # Add file handler
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(formatter)
+    root_logger.addHandler(file_handler)
+
+    # Add stdout handler if running with gunicorn (in container)
+    if 'gunicorn' in sys.argv[0]:
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setFormatter(formatter)
+        root_logger.addHandler(stdout_handler)
+
+    # Get the werkzeug logger and remove its default handlers
+    werkzeug_logger = logging.getLogger('werkzeug')
+    for handler in list(werkzeug_logger.handlers):
+        werkzeug_logger.removeHandler(handler)
+
+    logger.info(f"Starting mbz-rss-service v{config.VERSION} with the following configuration:")
+    logger.info(f"  - Log Level: {log_level_str}")
+    logger.info(f"  - Log File: {log_file}")
+    logger.info(f"  - Feeds File: {config.FEEDS_FILE_PATH}")
+    logger.info(f"  - Config File: {config.CONFIG_FILE_PATH}")
+    logger.info(f"  - MusicBrainz App Name: {config.MB_APP_NAME}")
+    logger.info(f"  - MusicBrainz App Version: {config.MB_VERSION}")
+    logger.info(f"  - MusicBrainz Contact: {config.MB_CONTACT}")
+    logger.info(f"  - MusicBrainz Log Level: {mbz_log_level_str}")
+    logger.info(f"  - Release Source: {config.RELEASE_SOURCE}")
+    logger.info(f"  - Background Refresh: {config.BACKGROUND_REFRESH}")
+    logger.info(f"  - Serve Stale: {config.SERVE_STALE}")
+    logger.info(f"  - Server-Timing Header: {config.SERVER_TIMING}")
+    logger.info(f"  - Housekeeping Interval: {config.HOUSEKEEPING_INTERVAL_SECONDS}s")
+
+
+def _route(rule, **options):
+    """Registers a view function, the routes are added to the app by create_app."""
+    def register(view_func):
+        _routes.append((rule, view_func, options))
+        return view_func
+    return register
 
-# Add stdout handler if running with gunicorn (in container)
-if 'gunicorn' in sys.argv[0]:
-    stdout_handler = logging.StreamHandler(sys.stdout)
-    stdout_handler.setFormatter(formatter)
-    root_logger.addHandler(stdout_handler)
 
+def inject_service_name():
+    return {'service_base_url': config.MBZ_SERVICE_BASE_URL}
 
-# Get the werkzeug logger and remove its default handlers
-werkzeug_logger = logging.getLogger('werkzeug')
-for handler in werkzeug_logger.handlers:
-    werkzeug_logger.removeHandler(handler)
 
-logger = logging.getLogger(__name__)
+def start_background_tasks():
+    """Starts the background refresh and housekeeping threads once per process.
 
+    Threads do not survive a fork, so they are started with the first request of every
+    worker instead of when the app is created, e.g. in the gunicorn master with --preload."""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        if config.BACKGROUND_REFRESH:
+            refresh_scheduler.start()
+        if config.HOUSEKEEPING_INTERVAL_SECONDS > 0:
+            housekeeping.start(config.HOUSEKEEPING_INTERVAL_SECONDS)
 
-logger.info(f"Starting mbz-rss-service v{config.VERSION} with the following configuration:")
-logger.info(f"  - Log Level: {log_level_str}")
-logger.info(f"  - Log File: {log_file}")
-logger.info(f"  - Feeds File: {config.FEEDS_FILE_PATH}")
-logger.info(f"  - Config File: {config.CONFIG_FILE_PATH}")
-logger.info(f"  - MusicBrainz App Name: {config.MB_APP_NAME}")
-logger.info(f"  - MusicBrainz App Version: {config.MB_VERSION}")
-logger.info(f"  - MusicBrainz Contact: {config.MB_CONTACT}")
-logger.info(f"  - MusicBrainz Log Level: {mbz_log_level_str}")
 
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.timings = {} if config.SERVER_TIMING else None
 
-# init
-musicbrainz.init_musicbrainz()
-app = Flask(__name__)
 
-@app.context_processor
-def inject_service_name():
-    return {'service_base_url': config.MBZ_SERVICE_BASE_URL}
+def finish_request_timing(response):
+    elapsed = time.perf_counter() - g.request_start
+    metrics.http_request_seconds.observe(elapsed, endpoint=request.endpoint or 'unknown')
+    if g.timings is not None:
+        timings = {**g.timings, 'total': elapsed}
+        response.headers['Server-Timing'] = ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+    return response
 
 class ReverseProxied(object):
     def __init__(self, app):
@@ -93,36 +164,45 @@ class ReverseProxied(object):
 
         return self.app(environ, start_response)
 
-app.wsgi_app = ReverseProxied(app.wsgi_app)
 
-app.template_folder = 'templates'
+def create_app():
+    """Creates the Flask app, set up so it can be created once before forking workers.
 
+    Importing the module has no side effects: logging and the MusicBrainz client are set up
+    here, feeds and settings are loaded on first use and background threads are started
+    per process, see start_background_tasks. Templates are compiled up front, so forked
+    workers share them instead of compiling them on their first requests."""
+    global _app
+    ensure_dirs()
+    _configure_logging()
+    musicbrainz.init_musicbrainz()
 
-def _get_cache_file_path(feed_id):
-    """Constructs the full path for a feed's cache file."""
-    return os.path.join(config.CACHE_DIR, f"{feed_id}.xml")
+    app = Flask(__name__)
+    app.template_folder = 'templates'
+    app.context_processor(inject_service_name)
+    app.before_request(start_background_tasks)
+    app.before_request(start_request_timing)
+    app.after_request(finish_request_timing)
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    app.wsgi_app = ReverseProxied(app.wsgi_app)
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+    _app = app
+    return app
 
 
-def _get_cache_last_build_date(cache_file):
-    """Parses the cache file and returns its last build date as a timezone-aware datetime object."""
-    if not os.path.exists(cache_file):
-        return None
+def __getattr__(name):
+    # keeps mbz_rss_service.main:app working, the app is created on first access
+    if name == 'app':
+        return _app or create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_feed_builds = SingleFlight()
 
-    try:
-        tree = ET.parse(cache_file)
-        root = tree.getroot()
-        last_build_date_str = root.findtext('channel/lastBuildDate')
-        if not last_build_date_str:
-            return None
 
-        last_build_date = parsedate_to_datetime(last_build_date_str)
-        # Ensure last_build_date is timezone-aware (in UTC)
-        if last_build_date.tzinfo is None:
-            return last_build_date.replace(tzinfo=timezone.utc)
-        return last_build_date
-    except (ET.ParseError, FileNotFoundError) as e:
-        logger.warning(f"Could not read or parse cache file {cache_file}: {e}")
-        return None
+_get_cache_file_path = feed_cache.get_cache_file_path
 
 
 def _is_cache_stale(last_build_date, feed_data, cache_time_hours):
@@ -145,35 +225,300 @@ def _is_cache_stale(last_build_date, feed_data, cache_time_hours):
     return False
 
 
-def _check_cache(feed_id):
-    """Checks for a valid cached feed and returns it if found."""
+def _get_cache_time_hours(meta=None):
+    """Returns the cache time of a feed build, partial builds are kept for partial_cache_minutes."""
+    service = config.get_settings().get('service', {})
+    if meta and meta.get('partial'):
+        return int(service.get('partial_cache_minutes', 15)) / 60
+    return int(service.get('cache_time_hours', 24))
+
+
+def _get_built_formats(feed_id):
+    """Returns the formats a feed is kept up to date in: RSS and every other cached format."""
+    return ['rss'] + [feed_format for feed_format in FEED_FORMATS
+                      if feed_format != 'rss' and feed_cache.get_meta(feed_id, feed_format)]
+
+
+def _get_due_formats(feed_data):
+    """Returns the built formats of a feed that should be rebuilt ahead of their cache turning stale."""
+    due_formats = []
+    for feed_format in _get_built_formats(feed_data['id']):
+        meta = feed_cache.get_meta(feed_data['id'], feed_format)
+        if _is_cache_stale(feed_cache.get_build_time(meta), feed_data,
+                           _get_cache_time_hours(meta) * config.REFRESH_AHEAD_FRACTION):
+            due_formats.append(feed_format)
+    return due_formats
+
+
+def _is_feed_due_for_refresh(feed_data):
+    """Determines if a feed should be rebuilt ahead of its cache turning stale."""
+    return bool(_get_due_formats(feed_data))
+
+
+def _send_cached_feed(feed_id, meta, max_age, feed_format='rss'):
+    """Serves a cached feed from the in-memory cache, or streams the file if it does not fit,
+    using a stored compressed variant if the client accepts it, and answers conditional
+    requests with 304 Not Modified."""
+    encoding = feed_cache.choose_encoding(request.accept_encodings)
+    if encoding not in meta.get('variants', {}):
+        encoding = None
+
+    etag = f"{meta['etag']}-{encoding}" if encoding else meta['etag']
+    last_modified = feed_cache.get_build_time(meta)
+    max_age = max(0, int(max_age))
+    content_type = FEED_FORMATS[feed_format][1]
+    variant_file = feed_cache.get_variant_path(_get_cache_file_path(feed_id, feed_format), encoding)
+    data = feed_cache.read_feed(feed_id, meta, encoding, feed_format)
+    if data is None:
+        response = send_file(variant_file, mimetype=content_type, etag=etag,
+                             last_modified=last_modified, max_age=max_age)
+    else:
+        response = Response(data, mimetype=content_type)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.max_age = max_age
+        response.make_conditional(request)
+    housekeeping.record_access(variant_file)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    return response
+
+
+def _check_cache(feed_id, feed_format='rss'):
+    """Checks for a valid cached feed and returns a response serving it if found.
+
+    A stale cached feed is still returned if stale serving is enabled and the background
+    refresh is running, the feed is then enqueued for a rebuild."""
     feed_data = config.get_feed(feed_id)
     if not feed_data:
         return None  # Feed doesn't exist, so no cache.
 
-    cache_file = _get_cache_file_path(feed_id)
-    last_build_date = _get_cache_last_build_date(cache_file)
+    with metrics.timed(metrics.feed_cache_lookup_seconds, 'cache'):
+        meta = feed_cache.get_meta(feed_id, feed_format)
+    last_build_date = feed_cache.get_build_time(meta)
+    cache_time_hours = _get_cache_time_hours(meta)
 
-    cache_time_hours = int(config.get_settings().get('service', {}).get('cache_time_hours', 24))
+    max_age = 0
+    if _is_cache_stale(last_build_date, feed_data, cache_time_hours):
+        if not last_build_date or not (config.SERVE_STALE and refresh_scheduler.is_running()):
+            metrics.feed_cache_requests.inc(result='miss')
+            return None
+        logger.debug(f"Serving stale feed for {feed_id}, refresh enqueued")
+        metrics.feed_cache_requests.inc(result='stale')
+        refresh_scheduler.enqueue(feed_id)
+    else:
+        metrics.feed_cache_requests.inc(result='hit')
+        age = datetime.now(timezone.utc) - last_build_date
+        max_age = (timedelta(hours=cache_time_hours) - age).total_seconds()
 
-    if not _is_cache_stale(last_build_date, feed_data, cache_time_hours):
-        try:
-            with open(cache_file, 'r') as f:
-                logger.debug(f"Serving cached feed for {feed_id}")
-                return f.read(), {"Content-Type": XML_CONTENT_TYPE}
-        except IOError as e:
-            logger.warning(f"Could not read cache file {cache_file}: {e}")
+    try:
+        logger.debug(f"Serving cached {feed_format} feed for {feed_id}")
+        return _send_cached_feed(feed_id, meta, max_age, feed_format)
+    except IOError as e:
+        logger.warning(f"Could not read cache file for feed {feed_id}: {e}")
 
     return None
 
 
-@app.route("/")
+def _build_feed(feed_data, feed_format='rss'):
+    """Generates a feed format from the artist release cache and writes it to the feed cache."""
+    with metrics.timed(metrics.feed_build_seconds, 'build'):
+        _build_feed_timed(feed_data, feed_format)
+
+
+def _get_max_items():
+    """Returns the number of items per feed page, 0 puts all items into one feed."""
+    return int(config.get_settings().get('service', {}).get('max_items', 0))
+
+
+def _load_releases(feed_data, refresh=True):
+    """Returns the releases of the feed's artists filtered by days_back, merged by release
+    group and newest first, and the ids of the artists whose releases could not be fetched."""
+    days_back = int(config.get_settings().get('service', {}).get('days_back', 0))
+    artist_ids = [artist['id'] for artist in feed_data.get('artists', [])]
+    release_lists, failed_artist_ids = artist_cache.get_feed_releases(artist_ids, refresh=refresh)
+    release_lists = [musicbrainz.filter_releases_by_age(releases, days_back) for releases in release_lists]
+    return models.collapse_releases(release_lists), failed_artist_ids
+
+
+def _get_last_page(releases):
+    max_items = _get_max_items()
+    if not max_items:
+        return 1
+    return max(1, math.ceil(len(releases) / max_items))
+
+
+def _get_page_links(feed_id, page, last_page, feed_format='rss'):
+    """Returns the RFC 5005 paging links of a feed page by relation."""
+    if not _get_max_items():
+        return {}
+    base_url = url_for('get_feed_rss', feed_id=feed_id, feed_format=None if feed_format == 'rss' else feed_format,
+                       _external=True)
+    page_url = lambda number: base_url if number == 1 else f"{base_url}?page={number}"
+    links = {'first': page_url(1), 'last': page_url(last_page)}
+    if page > 1:
+        links['previous'] = page_url(page - 1)
+    if page < last_page:
+        links['next'] = page_url(page + 1)
+    return links
+
+
+def _stream_feed(feed_data, releases, page=1, feed_format='rss'):
+    """Renders a feed page in a format as a stream of str chunks.
+
+    Returns the stream and a function returning the number of rendered items."""
+    page_releases = releases
+    max_items = _get_max_items()
+    if max_items:
+        page_releases = itertools.islice(releases, (page - 1) * max_items, page * max_items)
+
+    rendered = [0]
+    def count(items):
+        for item in items:
+            rendered[0] += 1
+            yield item
+
+    now = datetime.now(timezone.utc)
+    page_links = _get_page_links(feed_data['id'], page, _get_last_page(releases), feed_format)
+    chunks = stream_template(FEED_FORMATS[feed_format][0], feed=feed_data, releases=count(page_releases),
+                             last_build_date=formatdate(now.timestamp()),
+                             updated=now.strftime('%Y-%m-%dT%H:%M:%SZ'), page_links=page_links)
+    return chunks, lambda: rendered[0]
+
+
+def _build_feed_timed(feed_data, feed_format='rss'):
+    feed_id = feed_data['id']
+    logger.debug(f"Generating new {feed_format} feed for {feed_id}")
+    _prepare_feed_data(feed_data)
+    releases, failed_artist_ids = _load_releases(feed_data)
+    if failed_artist_ids:
+        # a partial build is replaced soon, instead of hiding releases for the whole cache time
+        logger.warning(f"Feed {feed_id} is built without current releases of {len(failed_artist_ids)} artists")
+        metrics.feed_partial_builds.inc()
+    chunks, get_item_count = _stream_feed(feed_data, releases, feed_format=feed_format)
+    try:
+        with metrics.timed(metrics.feed_render_seconds, 'render'):
+            cache_file = feed_cache.write_feed(feed_id, chunks, feed_data, get_item_count,
+                                               failed_artists=len(failed_artist_ids), feed_format=feed_format)
+        metrics.feed_size_bytes.observe(feed_cache.get_meta(feed_id, feed_format)['size'])
+        logger.debug(f"Cached feed '{feed_data['name']}' at {cache_file}")
+    except IOError as e:
+        logger.warning(f"Could not write feed '{feed_data['name']}' to cache: {e}")
+
+
+def _prepare_feed_data(feed_data):
+    # Add rfc822 formatted updated_at for template
+    if 'updated_at' in feed_data and feed_data['updated_at']:
+        updated_at_dt = datetime.fromisoformat(feed_data['updated_at'])
+        feed_data['updated_at_rfc822'] = formatdate(updated_at_dt.timestamp())
+    else:
+        # Fallback for older feeds without updated_at
+        now_utc = datetime.now(timezone.utc)
+        feed_data['updated_at_rfc822'] = formatdate(now_utc.timestamp())
+
+
+def _get_cache_version(feed_id, feed_format='rss'):
+    meta = feed_cache.get_meta(feed_id, feed_format)
+    return meta['etag'] + meta['build_time'] if meta else None
+
+
+def _build_feed_locked(feed_data, seen_version, feed_format):
+    feed_id = feed_data['id']
+    cache_file = _get_cache_file_path(feed_id, feed_format)
+    with file_lock(f"{cache_file}.lock"):
+        # another worker may have rebuilt the feed while we waited for the lock
+        if _get_cache_version(feed_id, feed_format) != seen_version:
+            logger.debug(f"Feed {feed_id} ({feed_format}) was rebuilt concurrently")
+            return
+        _build_feed(feed_data, feed_format)
+
+
+def _generate_feed(feed_data, feed_format='rss'):
+    """Builds a feed format, coalescing concurrent builds of it across threads and workers."""
+    seen_version = _get_cache_version(feed_data['id'], feed_format)
+    _feed_builds.do(f"{feed_data['id']}.{feed_format}", _build_feed_locked, feed_data, seen_version, feed_format)
+
+
+def _get_feed_path(feed_id, feed_format):
+    return f"/feed/{feed_id}" if feed_format == 'rss' else f"/feed/{feed_id}.{feed_format}"
+
+
+def _refresh_feed(feed_id):
+    """Rebuilds the due formats of a feed outside of a client request.
+
+    The feed may have been rebuilt since it was enqueued, by a request or by another worker's
+    scheduler, so formats that are no longer due are skipped."""
+    feed_data = config.get_feed(feed_id)
+    if not feed_data:
+        return
+    due_formats = _get_due_formats(feed_data)
+    if not due_formats:
+        logger.debug(f"Feed {feed_id} was refreshed since it was enqueued")
+        return
+    for feed_format in due_formats:
+        # the feed template links back to the service, so build it as if it was requested
+        with _app.test_request_context(_get_feed_path(feed_id, feed_format), base_url=config.MBZ_SERVICE_BASE_URL):
+            _generate_feed(feed_data, feed_format)
+
+
+def prebuild_feeds(feeds):
+    """Builds feeds outside of client requests, e.g. to warm the cache after a deploy.
+
+    The artists of all feeds are fetched once up front, every missing or stale one regardless
+    of artist_refresh_budget, then each feed is rendered from the artist cache in RSS and the
+    other formats it is cached in. Returns a report with the timings and the RSS result of
+    every feed."""
+    start = time.perf_counter()
+    artist_ids = list(dict.fromkeys(artist['id'] for feed in feeds for artist in feed.get('artists', [])))
+    _, failed_artist_ids = artist_cache.get_feed_releases(artist_ids, refresh_budget=0)
+    report = {
+        'artists': len(artist_ids),
+        'failed_artists': len(failed_artist_ids),
+        'fetch_seconds': time.perf_counter() - start,
+        'feeds': [],
+    }
+    for feed_data in feeds:
+        feed_start = time.perf_counter()
+        result = {'id': feed_data['id'], 'name': feed_data['name']}
+        seen_version = _get_cache_version(feed_data['id'])
+        try:
+            for feed_format in _get_built_formats(feed_data['id']):
+                with _app.test_request_context(_get_feed_path(feed_data['id'], feed_format),
+                                               base_url=config.MBZ_SERVICE_BASE_URL):
+                    _generate_feed(feed_data, feed_format)
+        except Exception as e:
+            result['error'] = str(e)
+        if 'error' not in result and _get_cache_version(feed_data['id']) == seen_version:
+            result['error'] = 'the feed could not be written to the cache'
+        if 'error' not in result:
+            meta = feed_cache.get_meta(feed_data['id'])
+            result.update(items=meta.get('item_count'), size=meta['size'], partial=meta.get('partial', False))
+        result['seconds'] = time.perf_counter() - feed_start
+        report['feeds'].append(result)
+    report['total_seconds'] = time.perf_counter() - start
+    return report
+
+
+refresh_scheduler = FeedRefreshScheduler(
+    get_feeds=lambda: config.feeds,
+    is_due=_is_feed_due_for_refresh,
+    build_feed=_refresh_feed,
+    scan_interval_seconds=config.REFRESH_SCAN_INTERVAL_SECONDS,
+    spacing_seconds=config.REFRESH_SPACING_SECONDS,
+    # restarted workers scan at different times instead of all rebuilding due feeds at once
+    first_scan_jitter_seconds=config.REFRESH_SCAN_INTERVAL_SECONDS,
+)
+
+
+@_route("/")
 def index():
     logger.debug("Request for index page")
     feeds = config.feeds
     return render_template('index.html', feeds=feeds)
 
-@app.route("/feed/create", methods=["POST"])
+@_route("/feed/create", methods=["POST"])
 def create_feed():
     feed_name = request.form.get('name')
     logger.debug(f"Request to create feed with name: {feed_name}")
@@ -181,21 +526,23 @@ def create_feed():
         config.add_feed(feed_name.strip())
     return redirect(url_for('index'))
 
-@app.route("/feed/<feed_id>/delete", methods=["POST"])
+@_route("/feed/<feed_id>/delete", methods=["POST"])
 def delete_feed(feed_id):
     logger.debug(f"Request to delete feed with id: {feed_id}")
     config.delete_feed(feed_id)
+    housekeeping.remove_feed_files(feed_id)
     return redirect(url_for('index'))
 
-@app.route("/feed/<feed_id>/edit")
+@_route("/feed/<feed_id>/edit")
 def edit_feed(feed_id):
     logger.debug(f"Request to edit feed with id: {feed_id}")
     feed = config.get_feed(feed_id)
     if not feed:
         return "Feed not found", 404
-    return render_template('feed.html', feed=feed)
+    import_job = bulk_import.get_job(request.args.get('import', ''))
+    return render_template('feed.html', feed=feed, import_job=import_job)
 
-@app.route("/feed/<feed_id>/artist/add", methods=["POST"])
+@_route("/feed/<feed_id>/artist/add", methods=["POST"])
 def add_artist(feed_id):
     artist_id = request.form.get('artist_id')
     artist_name = request.form.get('artist_name')
@@ -205,20 +552,47 @@ def add_artist(feed_id):
         config.add_artist_to_feed(feed_id, artist_id, artist_name, meta['links'])
     return redirect(url_for('edit_feed', feed_id=feed_id))
 
-@app.route("/feed/<feed_id>/artist/<artist_id>/remove", methods=["POST"])
+@_route("/feed/<feed_id>/artist/import", methods=["POST"])
+def import_artists(feed_id):
+    if not config.get_feed(feed_id):
+        return "Feed not found", 404
+    texts = [request.form.get('artist_ids', '')]
+    upload = request.files.get('file')
+    if upload:
+        texts.append(upload.read().decode('utf-8', errors='replace'))
+    artist_ids = bulk_import.extract_artist_ids(*texts)
+    logger.debug(f"Request to import {len(artist_ids)} artists into feed {feed_id}")
+    if not artist_ids:
+        return redirect(url_for('edit_feed', feed_id=feed_id))
+    job = bulk_import.start_import(feed_id, artist_ids)
+    return redirect(url_for('edit_feed', feed_id=feed_id, **{'import': job['id']}))
+
+@_route("/import/<job_id>")
+def import_status(job_id):
+    job = bulk_import.get_job(job_id)
+    if not job:
+        return jsonify({"error": "unknown import"}), 404
+    return jsonify(job)
+
+@_route("/feed/<feed_id>/artist/<artist_id>/remove", methods=["POST"])
 def remove_artist(feed_id, artist_id):
     logger.debug(f"Request to remove artist {artist_id} from feed {feed_id}")
     config.remove_artist_from_feed(feed_id, artist_id)
     return redirect(url_for('edit_feed', feed_id=feed_id))
 
-@app.route("/artist/search")
+@_route("/artist/search")
 def search_artist():
     query = request.args.get('q', '')
     logger.debug(f"Request to search for artist with query: '{query}'")
     artists = musicbrainz.search_artists(query)
     return jsonify(artists)
 
-@app.route("/settings", methods=["GET", "POST"])
+@_route("/artist/search/local")
+def search_local_artist():
+    query = request.args.get('q', '')
+    return jsonify(config.search_artists(query))
+
+@_route("/settings", methods=["GET", "POST"])
 def settings():
     if request.method == "POST":
         logger.debug("Request to update settings")
@@ -228,68 +602,133 @@ def settings():
         return redirect(url_for('settings'))
 
     logger.debug("Request for settings page")
-    return render_template('settings.html', settings=config)
+    return render_template('settings.html', settings=config, housekeeping=housekeeping.get_report())
+
+_opml_cache = (None, None)
+
 
-@app.route("/opml")
+def _get_opml_variants():
+    """Returns the ETag and the rendered OPML by encoding, rendering only when the feeds changed."""
+    global _opml_cache
+    key = (config.feeds_generation, request.url_root)
+    cached_key, cached = _opml_cache
+    if cached_key != key:
+        data = render_template('opml.xml', feeds=config.feeds).encode('utf-8')
+        cached = (hashlib.sha1(data).hexdigest(), {None: data, **feed_cache.compress_variants(data)})
+        _opml_cache = (key, cached)
+    return cached
+
+
+@_route("/opml")
 def opml():
     logger.debug("Request for OPML file")
-    feeds = config.feeds
-    opml_content = render_template('opml.xml', feeds=feeds)
-    return opml_content, {"Content-Type": XML_CONTENT_TYPE}
+    etag, variants = _get_opml_variants()
+    encoding = feed_cache.choose_encoding(request.accept_encodings)
+    response = Response(variants[encoding], content_type=XML_CONTENT_TYPE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        etag = f"{etag}-{encoding}"
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _negotiate_format():
+    """Picks the feed format from the Accept header of a request without a format suffix."""
+    media_type = request.accept_mimetypes.best_match(list(FORMAT_MEDIA_TYPES))
+    return FORMAT_MEDIA_TYPES.get(media_type, 'rss')
+
+
+@_route('/feed/<feed_id>')
+@_route('/feed/<feed_id>.<feed_format>')
+def get_feed_rss(feed_id, feed_format=None):
+    if feed_format is None:
+        response = make_response(_send_feed(feed_id, _negotiate_format()))
+        response.vary.add('Accept')
+        return response
+    if feed_format not in FEED_FORMATS:
+        return "Feed not found", 404
+    return _send_feed(feed_id, feed_format)
 
-@app.route('/feed/<feed_id>')
-def get_feed_rss(feed_id):
-    logger.debug(f"Request for RSS feed with id: {feed_id}")
+
+def _send_feed(feed_id, feed_format):
+    logger.debug(f"Request for {feed_format} feed with id: {feed_id}")
+
+    page = request.args.get('page', 1, type=int)
+    if page != 1:
+        return _send_feed_page(feed_id, page, feed_format)
 
     # Check cache for a valid feed before generating it
-    cached_response = _check_cache(feed_id)
+    cached_response = _check_cache(feed_id, feed_format)
     if cached_response:
         return cached_response
     
     # cache outdated or not found, generate a new feed
-    logger.debug(f"Generating new feed for {feed_id}")
     feed_data = config.get_feed(feed_id)
     if not feed_data:
         return "Feed not found", 404
 
-    # Add rfc822 formatted updated_at for template
-    if 'updated_at' in feed_data and feed_data['updated_at']:
-        updated_at_dt = datetime.fromisoformat(feed_data['updated_at'])
-        feed_data['updated_at_rfc822'] = formatdate(updated_at_dt.timestamp())
-    else:
-        # Fallback for older feeds without updated_at
-        now_utc = datetime.now(timezone.utc)
-        feed_data['updated_at_rfc822'] = formatdate(now_utc.timestamp())
+    _generate_feed(feed_data, feed_format)
+    meta = feed_cache.get_meta(feed_id, feed_format)
+    if meta:
+        try:
+            return _send_cached_feed(feed_id, meta, _get_cache_time_hours(meta) * 3600, feed_format)
+        except IOError as e:
+            logger.warning(f"Could not read cache file for feed {feed_id}: {e}")
+    # the feed could not be cached, stream it straight to the client
+    chunks, _ = _stream_feed(feed_data, _load_releases(feed_data, refresh=False)[0], feed_format=feed_format)
+    return Response(chunks, mimetype=FEED_FORMATS[feed_format][1])
 
-    all_releases = []
-    if 'artists' in feed_data:
-        for artist in feed_data['artists']:
-            releases = musicbrainz.get_artist_releases(artist['id'])
-            all_releases.extend(releases)
 
-    # Sort releases by date, newest first
-    all_releases.sort(key=lambda r: r.get('date', '0000-00-00'), reverse=True)
+def _get_page_etag(meta, page, releases):
+    """Returns the ETag of an older feed page.
 
-    last_build_date = formatdate(datetime.now(timezone.utc).timestamp())
-    
-    rss_content = render_template('feed.xml', feed=feed_data, releases=all_releases, last_build_date=last_build_date)
-    
-    cache_dir = config.CACHE_DIR
-    os.makedirs(cache_dir, exist_ok=True)
-    cache_file = os.path.join(cache_dir, f"{feed_id}.xml")
-    try:
-        with open(cache_file, 'w') as f:
-            f.write(rss_content)
-        logger.debug(f"Cached feed '{feed_data['name']}' at {cache_file}")
-    except IOError as e:
-        logger.warning(f"Could not write feed '{feed_data['name']}' to cache file {cache_file}: {e}")
+    Pages are rendered from the artist entries, which can change without a rebuild of the
+    first page (e.g. a shared artist refreshed by another feed), so the releases on the page
+    and the number of pages are part of the tag, next to the first page build."""
+    max_items = _get_max_items()
+    page_releases = releases[(page - 1) * max_items:page * max_items]
+    digest = hashlib.sha1(f"{meta['etag']}:{page}:{_get_last_page(releases)}".encode())
+    for release in page_releases:
+        digest.update(json.dumps([release.to_dict(), release.artists], sort_keys=True).encode())
+    return f"{digest.hexdigest()}-p{page}"
 
-    return rss_content, {"Content-Type": XML_CONTENT_TYPE}
 
-@app.route("/health")
+def _send_feed_page(feed_id, page, feed_format='rss'):
+    """Serves an older page of a paged feed, rendered from the artist release cache."""
+    feed_data = config.get_feed(feed_id)
+    if not feed_data or not _get_max_items() or page < 1:
+        return "Feed page not found", 404
+
+    meta = feed_cache.get_meta(feed_id, feed_format)
+    if meta is None:
+        _generate_feed(feed_data, feed_format)
+        meta = feed_cache.get_meta(feed_id, feed_format)
+    releases, _ = _load_releases(feed_data, refresh=False)
+    if page > _get_last_page(releases):
+        return "Feed page not found", 404
+
+    etag = _get_page_etag(meta, page, releases) if meta else None
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        _prepare_feed_data(feed_data)
+        chunks, _ = _stream_feed(feed_data, releases, page, feed_format)
+        response = Response(chunks, mimetype=FEED_FORMATS[feed_format][1])
+    if etag:
+        response.set_etag(etag)
+    response.cache_control.max_age = int(_get_cache_time_hours(meta) * 3600)
+    response.cache_control.public = True
+    return response
+
+@_route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@_route("/health")
 def health_check():
     logger.debug("Health check requested")
     return jsonify({"status": "ok"})
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    create_app().run(host="0.0.0.0", port=8080, debug=True)
@@ -0,0 +1,255 @@
+import http.client
+import logging
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlencode
+import musicbrainzngs
+from .fsutil import file_lock
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth another attempt after a backoff
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """A token bucket rate limiter, refilled with rate tokens per second up to burst tokens.
+
+    With a state_file the bucket is shared by all processes using the same file, e.g. all
+    gunicorn workers, otherwise it is shared by the threads of this process."""
+
+    def __init__(self, rate, burst=1, state_file=None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._waiting = 0
+
+    def _read_state(self):
+        if self.state_file is None:
+            return self._tokens, self._updated
+        try:
+            with open(self.state_file, 'r') as f:
+                tokens, updated = f.read().split()
+                return float(tokens), float(updated)
+        except (OSError, ValueError):
+            return self.burst, time.time()
+
+    def _write_state(self, tokens, updated):
+        if self.state_file is None:
+            self._tokens, self._updated = tokens, updated
+            return
+        with open(self.state_file, 'w') as f:
+            f.write(f"{tokens} {updated}")
+
+    def _take(self):
+        """Takes a token if one is available, otherwise returns the seconds until the next one."""
+        with self._lock:
+            if self.state_file is None:
+                return self._take_locked()
+            with file_lock(f"{self.state_file}.lock"):
+                return self._take_locked()
+
+    def _take_locked(self):
+        now = time.time()
+        tokens, updated = self._read_state()
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._write_state(tokens, now)
+        return wait
+
+    def acquire(self, low_priority=False):
+        """Blocks until a token is available, returns the seconds spent waiting.
+
+        Low priority callers only take a token while no normal priority caller of this
+        process is waiting for one."""
+        waited = 0.0
+        if not low_priority:
+            with self._lock:
+                self._waiting += 1
+        try:
+            while True:
+                wait = 1 / self.rate if low_priority and self._waiting else self._take()
+                if not wait:
+                    return waited
+                time.sleep(wait)
+                waited += wait
+        finally:
+            if not low_priority:
+                with self._lock:
+                    self._waiting -= 1
+
+
+class CircuitBreaker:
+    """Stops calls to a failing service for cooldown_seconds after failure_threshold
+    consecutive failures. After the cooldown a single trial call is let through: a success
+    closes the circuit, a failure opens it for another cooldown. A failure_threshold of 0
+    disables the breaker."""
+
+    def __init__(self, failure_threshold=5, cooldown_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial_running = False
+
+    def allow(self):
+        """Returns False while the circuit is open, callers should fail fast."""
+        with self._lock:
+            if not self.failure_threshold or self._failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._open_until or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.failure_threshold and self._failures >= self.failure_threshold:
+                logger.info("MusicBrainz is reachable again, closing the circuit")
+            self._failures = 0
+            self._trial_running = False
+        metrics.musicbrainz_circuit_open.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if not self.failure_threshold or self._failures < self.failure_threshold:
+                return
+            self._open_until = time.monotonic() + self.cooldown_seconds
+        logger.warning(f"MusicBrainz failed {self._failures} times in a row, "
+                       f"pausing requests for {self.cooldown_seconds}s")
+        metrics.musicbrainz_circuit_open.set(1)
+
+
+class MusicBrainzClient:
+    """A thread-safe client for the MusicBrainz XML web service.
+
+    Each thread keeps its own keep-alive connection, every request takes a token from the
+    shared rate limiter, and transient errors (503 rate limiting, 5xx, dropped connections)
+    are retried with exponential backoff. Responses are parsed with musicbrainzngs, so the
+    results have the same structure as the musicbrainzngs API calls.
+
+    Every failed attempt counts towards the circuit breaker. While it is open requests fail
+    immediately with a NetworkError instead of waiting for the rate limiter and retries."""
+
+    def __init__(self, hostname, use_https, user_agent, limiter, timeout=30, max_retries=5, backoff_seconds=1.0,
+                 breaker=None):
+        self.hostname = hostname
+        self.use_https = use_https
+        self.user_agent = user_agent
+        self.limiter = limiter
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.breaker = breaker or CircuitBreaker(failure_threshold=0)
+        self._local = threading.local()
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.use_https else http.client.HTTPConnection
+            connection = connection_class(self.hostname, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _get_retry_delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_seconds * (2 ** attempt)
+
+    def request(self, path, params, low_priority=False):
+        """Sends a GET request to /ws/2/<path> and returns the parsed response."""
+        url = f"/ws/2/{path}?{urlencode(sorted((k, v) for k, v in params.items() if v is not None))}"
+        endpoint = f"{path.split('/')[0]}-lookup" if '/' in path else path
+        headers = {'User-Agent': self.user_agent}
+        last_error = None
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self._get_retry_delay(attempt - 1, retry_after)
+                logger.info(f"Retrying MusicBrainz request {url} in {delay:.1f}s (#{attempt})")
+                time.sleep(delay)
+
+            if not self.breaker.allow():
+                metrics.musicbrainz_errors.inc(endpoint=endpoint, reason='circuit_open')
+                raise musicbrainzngs.NetworkError(f"circuit open after repeated failures, last: {last_error}")
+            waited = self.limiter.acquire(low_priority)
+            metrics.rate_limiter_wait_seconds.observe(waited)
+            metrics.record_timing('mb_rate_wait', waited)
+            try:
+                with metrics.timed(metrics.musicbrainz_request_seconds, 'mb_request', endpoint=endpoint):
+                    connection = self._get_connection()
+                    connection.request('GET', url, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+            except (http.client.HTTPException, socket.timeout, ConnectionError) as e:
+                # dropped keep-alive connections and timeouts, reconnect on the next attempt
+                self._reset_connection()
+                self.breaker.record_failure()
+                metrics.musicbrainz_errors.inc(endpoint=endpoint, reason='network')
+                last_error, retry_after = e, None
+                continue
+            except OSError as e:
+                self._reset_connection()
+                self.breaker.record_failure()
+                metrics.musicbrainz_errors.inc(endpoint=endpoint, reason='network')
+                raise musicbrainzngs.NetworkError(cause=e)
+
+            if response.status == 200:
+                self.breaker.record_success()
+                return musicbrainzngs.musicbrainz.mb_parser_xml(body)
+            metrics.musicbrainz_errors.inc(endpoint=endpoint, reason=f"http_{response.status}")
+            if response.status in RETRY_STATUS_CODES:
+                self.breaker.record_failure()
+                logger.info(f"MusicBrainz returned HTTP {response.status} for {url}")
+                last_error = f"HTTP {response.status}"
+                retry_after = response.getheader('Retry-After')
+                continue
+            # the service answered, a client error does not count as an outage
+            self.breaker.record_success()
+            raise musicbrainzngs.ResponseError(f"HTTP {response.status} for {url}")
+
+        raise musicbrainzngs.NetworkError(f"retried {self.max_retries} times: {last_error}")
+
+    def browse_releases(self, artist, release_type=(), includes=(), limit=None, offset=None):
+        return self.request('release', {
+            'artist': artist,
+            'type': '|'.join(release_type) or None,
+            'inc': ' '.join(includes) or None,
+            'limit': limit,
+            'offset': offset,
+        })
+
+    def search_artists(self, query, limit=None, low_priority=False):
+        return self.request('artist', {'query': query, 'limit': limit}, low_priority)
+
+    def get_artist_by_id(self, artist_id, includes=()):
+        return self.request(f"artist/{artist_id}", {'inc': ' '.join(includes) or None})
+
+
+def create_client(config):
+    """Creates a client from the service configuration, the rate limit is shared through CACHE_DIR."""
+    user_agent = f"{config.MB_APP_NAME}/{config.MB_VERSION} ( {config.MB_CONTACT} )"
+    limiter = TokenBucket(config.MB_RATE_LIMIT, config.MB_RATE_BURST,
+                          state_file=os.path.join(config.CACHE_DIR, 'mb-ratelimit'))
+    breaker = CircuitBreaker(config.MB_BREAKER_THRESHOLD, config.MB_BREAKER_COOLDOWN_SECONDS)
+    return MusicBrainzClient(config.MB_HOSTNAME, config.MB_HTTPS, user_agent, limiter,
+                             timeout=config.MB_TIMEOUT_SECONDS, max_retries=config.MB_MAX_RETRIES, breaker=breaker)
@@ -0,0 +1,287 @@
+import bz2
+import gzip
+import json
+import logging
+import lzma
+import os
+import re
+import tarfile
+import time
+import musicbrainzngs
+from . import storage
+from .search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# rows written per transaction while importing a dump
+IMPORT_BATCH_SIZE = 5000
+
+# search results are counted up to this many artists, enough to tell if a result set is complete
+SEARCH_COUNT_LIMIT = 1000
+
+# the query lookup_artist_names sends, e.g. "arid:<mbid> OR arid:<mbid>"
+ARID_QUERY_PATTERN = re.compile(r'^\s*arid:([0-9a-f-]{36})(?:\s+OR\s+arid:[0-9a-f-]{36})*\s*$', re.IGNORECASE)
+ARID_PATTERN = re.compile(r'arid:([0-9a-f-]{36})', re.IGNORECASE)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS artists (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS artist_names USING fts5(artist_id UNINDEXED, name);
+    CREATE TABLE IF NOT EXISTS releases (
+        id TEXT PRIMARY KEY,
+        types TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS release_artists (
+        artist_id TEXT NOT NULL,
+        release_id TEXT NOT NULL,
+        PRIMARY KEY (artist_id, release_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS release_artists_release ON release_artists(release_id);
+    CREATE TABLE IF NOT EXISTS dump_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+
+def _flag(value):
+    """Formats JSON booleans and numbers like the musicbrainzngs XML parser does."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _normalize_url_relations(relations):
+    urls = []
+    for relation in relations or []:
+        if relation.get('target-type') != 'url' or not relation.get('url'):
+            continue
+        url = {'type': relation.get('type'), 'target': relation['url']['resource']}
+        if relation.get('type-id'):
+            url['type-id'] = relation['type-id']
+        urls.append(url)
+    return urls
+
+
+def _normalize_release_group(group):
+    normalized = {'id': group['id'], 'title': group.get('title', '')}
+    if group.get('primary-type'):
+        normalized['type'] = group['primary-type']
+        normalized['primary-type'] = group['primary-type']
+    if group.get('secondary-types'):
+        normalized['secondary-type-list'] = list(group['secondary-types'])
+    if group.get('first-release-date'):
+        normalized['first-release-date'] = group['first-release-date']
+    return normalized
+
+
+def normalize_release(release):
+    """Converts a release of the JSON dump to the structure of a musicbrainzngs release browse
+    result with release-groups and url-rels."""
+    normalized = {'id': release['id'], 'title': release['title']}
+    for key in ('status', 'disambiguation', 'date', 'country', 'barcode'):
+        if release.get(key):
+            normalized[key] = release[key]
+    if release.get('cover-art-archive'):
+        normalized['cover-art-archive'] = {key: _flag(value) for key, value in release['cover-art-archive'].items()}
+    if release.get('release-group'):
+        normalized['release-group'] = _normalize_release_group(release['release-group'])
+    urls = _normalize_url_relations(release.get('relations'))
+    if urls:
+        normalized['url-relation-list'] = urls
+    return normalized
+
+
+def normalize_artist(artist):
+    """Converts an artist of the JSON dump to the structure of a musicbrainzngs artist lookup
+    with url-rels, including the aliases a search result has."""
+    normalized = {'id': artist['id'], 'name': artist['name'], 'sort-name': artist.get('sort-name', artist['name'])}
+    for key in ('type', 'country', 'disambiguation'):
+        if artist.get(key):
+            normalized[key] = artist[key]
+    aliases = [{'alias': alias['name'], 'sort-name': alias.get('sort-name', alias['name'])}
+               for alias in artist.get('aliases') or [] if alias.get('name')]
+    if aliases:
+        normalized['alias-list'] = aliases
+    urls = _normalize_url_relations(artist.get('relations'))
+    if urls:
+        normalized['url-relation-list'] = urls
+    return normalized
+
+
+def _release_types(release):
+    """Returns the release group types of a release as "|album|live|", for type filters."""
+    group = release.get('release-group') or {}
+    types = [group.get('primary-type')] + list(group.get('secondary-types') or [])
+    return '|' + '|'.join(t.lower() for t in types if t) + '|'
+
+
+class DumpClient:
+    """Answers the MusicBrainz client calls from a local database imported from the JSON data
+    dumps, see import_dump. Results have the structure of the musicbrainzngs API calls, so the
+    dump can replace the web service client; there is no rate limit."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = storage.SqliteConnections(db_path)
+        if not os.path.exists(db_path):
+            logger.warning(f"MusicBrainz dump database {db_path} does not exist, import a dump with "
+                           f"python -m mbz_rss_service import-dump")
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        storage.connect_sqlite(db_path, SCHEMA).close()
+
+    def _connection(self):
+        return self._connections.get()
+
+    def browse_releases(self, artist, release_type=(), includes=(), limit=None, offset=None):
+        # like the web service, releases of any of the given release group types are returned
+        types = [f"%|{t.lower()}|%" for t in release_type]
+        type_filter = f" AND ({' OR '.join('r.types LIKE ?' for _ in types)})" if types else ''
+        connection = self._connection()
+        count = connection.execute(
+            f"SELECT COUNT(*) FROM release_artists ra JOIN releases r ON r.id = ra.release_id "
+            f"WHERE ra.artist_id = ?{type_filter}", (artist, *types)).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT r.data FROM release_artists ra JOIN releases r ON r.id = ra.release_id "
+            f"WHERE ra.artist_id = ?{type_filter} ORDER BY r.id LIMIT ? OFFSET ?",
+            (artist, *types, limit or 25, offset or 0))
+        return {'release-list': [json.loads(data) for data, in rows], 'release-count': count}
+
+    def get_artist_by_id(self, artist_id, includes=()):
+        row = self._connection().execute('SELECT data FROM artists WHERE id = ?', (artist_id,)).fetchone()
+        if row is None:
+            raise musicbrainzngs.ResponseError(f"artist {artist_id} is not in the MusicBrainz dump")
+        return {'artist': json.loads(row[0])}
+
+    def _get_artists(self, artist_ids):
+        connection = self._connection()
+        artists = []
+        for artist_id in artist_ids:
+            row = connection.execute('SELECT data FROM artists WHERE id = ?', (artist_id,)).fetchone()
+            if row:
+                artists.append(json.loads(row[0]))
+        return artists
+
+    def search_artists(self, query, limit=None, offset=None, low_priority=False):
+        """Finds artists with a name, sort name or alias containing words starting with every
+        word of the query. The arid: queries of musicbrainz.lookup_artist_names are lookups."""
+        limit = limit or 25
+        if ARID_QUERY_PATTERN.match(query):
+            artists = self._get_artists(ARID_PATTERN.findall(query))[:limit]
+            return {'artist-list': artists, 'artist-count': len(artists)}
+
+        words = normalize_query(query).split()
+        if not words:
+            return {'artist-list': [], 'artist-count': 0}
+        match = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+        connection = self._connection()
+        artist_ids = [artist_id for artist_id, in connection.execute(
+            'SELECT artist_id FROM artist_names WHERE artist_names MATCH ? '
+            'GROUP BY artist_id ORDER BY MIN(rank) LIMIT ? OFFSET ?', (match, limit, offset or 0))]
+        count = connection.execute(
+            'SELECT COUNT(*) FROM (SELECT DISTINCT artist_id FROM artist_names WHERE artist_names MATCH ? LIMIT ?)',
+            (match, SEARCH_COUNT_LIMIT)).fetchone()[0]
+        return {'artist-list': self._get_artists(artist_ids), 'artist-count': count}
+
+
+def _open_lines(file_path):
+    """Yields (entity, line) for every line of a dump file.
+
+    Accepts the dump archives (e.g. release.tar.xz with mbdump/release) and plain or
+    gzip/bzip2/xz compressed JSON lines files. The entity is the file name inside an
+    archive, e.g. "release", or None for plain files."""
+    if tarfile.is_tarfile(file_path):
+        with tarfile.open(file_path, 'r|*') as archive:
+            for member in archive:
+                if not member.isfile() or os.path.dirname(member.name) != 'mbdump':
+                    continue
+                entity = os.path.basename(member.name)
+                for line in archive.extractfile(member):
+                    yield entity, line.decode('utf-8')
+        return
+    opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}.get(os.path.splitext(file_path)[1], open)
+    with opener(file_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield None, line
+
+
+def _get_entity(entity, record):
+    if entity in ('artist', 'release'):
+        return entity
+    if entity is None:
+        # plain files may mix entities, releases are the records with a release group
+        if 'release-group' in record:
+            return 'release'
+        if 'sort-name' in record:
+            return 'artist'
+    return None
+
+
+def _import_artist(connection, artist):
+    normalized = normalize_artist(artist)
+    connection.execute('INSERT OR REPLACE INTO artists (id, data) VALUES (?, ?)',
+                       (artist['id'], json.dumps(normalized)))
+    connection.execute('DELETE FROM artist_names WHERE artist_id = ?', (artist['id'],))
+    names = dict.fromkeys([normalized['name'], normalized['sort-name']] +
+                          [alias['alias'] for alias in normalized.get('alias-list', [])])
+    connection.executemany('INSERT INTO artist_names (artist_id, name) VALUES (?, ?)',
+                           ((artist['id'], name) for name in names))
+
+
+def _import_release(connection, release):
+    connection.execute('INSERT OR REPLACE INTO releases (id, types, data) VALUES (?, ?, ?)',
+                       (release['id'], _release_types(release), json.dumps(normalize_release(release))))
+    connection.execute('DELETE FROM release_artists WHERE release_id = ?', (release['id'],))
+    connection.executemany('INSERT OR IGNORE INTO release_artists (artist_id, release_id) VALUES (?, ?)',
+                           ((credit['artist']['id'], release['id'])
+                            for credit in release.get('artist-credit') or [] if credit.get('artist')))
+
+
+def import_dump(file_paths, db_path):
+    """Imports artists and releases from MusicBrainz JSON dump files into the dump database.
+
+    Records replace the stored ones with the same MBID, so newer dumps, or files holding only
+    changed entities, can be imported over an existing database. Other entities in the dump
+    are skipped. Returns the number of imported records by entity."""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    connection = storage.connect_sqlite(db_path, SCHEMA)
+    counts = {'artist': 0, 'release': 0, 'skipped': 0}
+    start = time.monotonic()
+    try:
+        for file_path in file_paths:
+            logger.info(f"Importing MusicBrainz dump {file_path}")
+            pending = 0
+            connection.execute('BEGIN')
+            for entity, line in _open_lines(file_path):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                entity = _get_entity(entity, record)
+                if entity == 'artist':
+                    _import_artist(connection, record)
+                elif entity == 'release':
+                    _import_release(connection, record)
+                else:
+                    counts['skipped'] += 1
+                    continue
+                counts[entity] += 1
+                pending += 1
+                if pending >= IMPORT_BATCH_SIZE:
+                    connection.execute('COMMIT')
+                    connection.execute('BEGIN')
+                    pending = 0
+            connection.execute('INSERT OR REPLACE INTO dump_meta (key, value) VALUES (?, ?)',
+                                (f"imported:{os.path.basename(file_path)}", time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())))
+            connection.execute('COMMIT')
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+    logger.info(f"Imported {counts['artist']} artists and {counts['release']} releases "
+                f"in {time.monotonic() - start:.1f}s")
+    return counts
@@ -0,0 +1,163 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_value(labels, value))
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label set."""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """A value per label set that can go up and down."""
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Counts observations in cumulative buckets per label set, with their sum and count."""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_value(self, labels, value):
+        counts, total = value
+        lines = [f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {count}"
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+def render():
+    """Returns all metrics of this process in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+_local = threading.local()
+
+
+def record_timing(name, seconds):
+    """Adds a duration to the timing breakdown of the current request, if one is collected,
+    or to the timings collected by collect_timings in this thread."""
+    if has_request_context():
+        timings = getattr(g, 'timings', None)
+    else:
+        timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def add_timings(timings):
+    """Adds durations collected in another thread to the timing breakdown of the current request."""
+    for name, seconds in timings.items():
+        record_timing(name, seconds)
+
+
+@contextmanager
+def collect_timings():
+    """Collects the durations recorded in this thread, which has no request context (e.g. a pool
+    thread working for a request), into the yielded dict. See add_timings."""
+    previous = getattr(_local, 'timings', None)
+    _local.timings = {}
+    try:
+        yield _local.timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def timed(histogram, timing_name=None, **labels):
+    """Observes the duration of the block in histogram and the current request's timing breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        if timing_name:
+            record_timing(timing_name, elapsed)
+
+
+feed_cache_requests = Counter('mbz_feed_cache_requests_total', 'Feed cache lookups by result (hit, stale, miss).')
+feed_memory_cache_requests = Counter('mbz_feed_memory_cache_requests_total', 'In-memory feed cache lookups by result (hit, miss).')
+feed_memory_cache_bytes = Gauge('mbz_feed_memory_cache_bytes', 'Bytes of rendered feeds held in memory.')
+feed_cache_lookup_seconds = Histogram('mbz_feed_cache_lookup_seconds', 'Time to look up the metadata of a cached feed.')
+feed_build_seconds = Histogram('mbz_feed_build_seconds', 'Time to build a feed, including MusicBrainz requests.')
+feed_partial_builds = Counter('mbz_feed_partial_builds_total', 'Feed builds with artists whose releases could not be fetched.')
+feed_render_seconds = Histogram('mbz_feed_render_seconds', 'Time to render the feed template and write it to the cache.')
+feed_size_bytes = Histogram('mbz_feed_size_bytes', 'Size of rendered feeds.', buckets=SIZE_BUCKETS)
+musicbrainz_request_seconds = Histogram('mbz_musicbrainz_request_seconds', 'MusicBrainz web service request latency by endpoint.')
+musicbrainz_circuit_open = Gauge('mbz_musicbrainz_circuit_open', 'Whether the MusicBrainz circuit breaker is open (1) or closed (0).')
+musicbrainz_errors = Counter('mbz_musicbrainz_errors_total', 'Failed MusicBrainz requests by endpoint and reason.')
+artist_fetch_seconds = Histogram('mbz_artist_fetch_seconds', 'Time to fetch all releases of an artist.')
+rate_limiter_wait_seconds = Histogram('mbz_rate_limiter_wait_seconds', 'Time spent waiting for the MusicBrainz rate limiter.')
+yaml_save_seconds = Histogram('mbz_yaml_save_seconds', 'Time to save a YAML configuration file.')
+http_request_seconds = Histogram('mbz_http_request_seconds', 'HTTP request duration by endpoint.')
@@ -0,0 +1,169 @@
+import logging
+from datetime import datetime
+from email.utils import formatdate
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# link name by host, "*." entries also match subdomains (www.imdb.com, m.imdb.com)
+LINK_HOSTS = {
+    'imdb.com': 'IMDb',
+    '*.imdb.com': 'IMDb',
+    'music.apple.com': 'apple',
+    'music.amazon.com': 'amazon',
+    'open.spotify.com': 'spotify',
+    'qobuz.com': 'qobuz',
+    '*.qobuz.com': 'qobuz',
+    'deezer.com': 'deezer',
+    '*.deezer.com': 'deezer',
+    'beatport.com': 'beatport',
+    '*.beatport.com': 'beatport',
+}
+
+DATE_FORMATS = {4: '%Y', 7: '%Y-%m', 10: '%Y-%m-%d'}
+
+
+def classify_link(url):
+    """Returns the link name of an https URL on a known host, or None."""
+    parts = urlsplit(url)
+    if parts.scheme != 'https' or not parts.hostname:
+        return None
+    host = parts.hostname
+    name = LINK_HOSTS.get(host)
+    while name is None and '.' in host:
+        host = host.split('.', 1)[1]
+        name = LINK_HOSTS.get(f"*.{host}")
+    return name
+
+
+def get_relation_links(relations):
+    """Extracts the named links from a MusicBrainz URL relation list, the last one of a kind wins."""
+    links = {}
+    for relation in relations:
+        target = relation.get('target')
+        name = classify_link(target) if target else None
+        if name:
+            links[name] = target
+    return links
+
+
+def parse_release_date(release_date, release_title=''):
+    """Parses a YYYY, YYYY-MM or YYYY-MM-DD date, returns the datetime and its RFC 822 form."""
+    date_format = DATE_FORMATS.get(len(release_date or ''))
+    if date_format:
+        try:
+            date = datetime.strptime(release_date, date_format)
+            return date, formatdate(date.timestamp())
+        except ValueError:
+            pass
+    if release_date and release_date != 'Unknown':
+        logger.warning(f"Could not parse date format '{release_date}' for release '{release_title}'")
+    return None, None
+
+
+def pad_date(release_date, end=False):
+    """Expands a partial YYYY or YYYY-MM date to YYYY-MM-DD, anything else is no date ('').
+
+    The date is padded to the first day of the period, or with end to a date that compares
+    after every day of it (-12-31, -31 for every month)."""
+    if not release_date[:1].isdigit():
+        return ''
+    padding = {4: '-12-31', 7: '-31'} if end else {4: '-01-01', 7: '-01'}
+    return release_date + padding.get(len(release_date), '')
+
+
+class Release:
+    """An album release of one or more artists of a feed, as rendered into the feed formats.
+
+    Releases of the same release group (editions, countries) and the same release credited to
+    several artists are merged into one, see collapse_releases. The RFC 822 and ISO 8601
+    dates are computed when a release is created, not while rendering."""
+
+    __slots__ = ('id', 'title', 'date', 'sort_date', 'pub_date', 'iso_date', 'release_group_id',
+                 'cover_art_id', 'links', 'artists')
+
+    def __init__(self, id, title, date, pub_date, release_group_id, has_cover_art, links, artists):
+        self.id = id
+        self.title = title
+        self.date = date
+        self.sort_date = pad_date(date)
+        self.pub_date = pub_date
+        self.iso_date = f"{self.sort_date}T00:00:00Z" if self.sort_date else None
+        self.release_group_id = release_group_id
+        self.cover_art_id = id if has_cover_art else None
+        self.links = links
+        # artist id -> name, in the order the artists were merged
+        self.artists = artists
+
+    @classmethod
+    def from_musicbrainz(cls, release, artist_id, artist_name):
+        """Creates a release from a musicbrainzngs release browse result."""
+        date = release.get('date') or 'Unknown'
+        _, pub_date = parse_release_date(date, release['title'])
+        return cls(release['id'], release['title'], date, pub_date, release.get('release-group', {}).get('id'),
+                   release.get('cover-art-archive', {}).get('artwork') == 'true',
+                   get_relation_links(release.get('url-relation-list', [])), {artist_id: artist_name})
+
+    @classmethod
+    def from_dict(cls, release):
+        """Creates a release from its artist cache form, see to_dict."""
+        return cls(release['id'], release['title'], release.get('date', 'Unknown'), release.get('pub_date'),
+                   release.get('release-group', {}).get('id'), release.get('hasCoverArt', False),
+                   release.get('links') or {}, {release['artist']['id']: release['artist']['name']})
+
+    def to_dict(self):
+        """Returns the JSON form kept in the artist cache (for the first artist)."""
+        artist_id, artist_name = next(iter(self.artists.items()))
+        release = {
+            'artist': {'name': artist_name, 'id': artist_id},
+            'hasCoverArt': self.cover_art_id is not None,
+            'id': self.id,
+            'title': self.title,
+            'date': self.date,
+            'pub_date': self.pub_date,
+            'links': self.links,
+        }
+        if self.release_group_id:
+            release['release-group'] = {'id': self.release_group_id}
+        return release
+
+    @property
+    def artist_names(self):
+        return ' & '.join(self.artists.values())
+
+    def merge(self, other):
+        """Merges another edition or artist credit of this release into it.
+
+        The earliest dated edition is kept, its cover art and links are completed from the
+        other editions."""
+        for artist_id, artist_name in other.artists.items():
+            self.artists.setdefault(artist_id, artist_name)
+        if other.sort_date and (not self.sort_date or other.sort_date < self.sort_date):
+            cover_art_id, links = self.cover_art_id, self.links
+            self.id, self.title, self.date = other.id, other.title, other.date
+            self.sort_date, self.pub_date, self.iso_date = other.sort_date, other.pub_date, other.iso_date
+            self.cover_art_id, self.links = other.cover_art_id, other.links
+        else:
+            cover_art_id, links = other.cover_art_id, other.links
+        self.cover_art_id = self.cover_art_id or cover_art_id
+        self.links = {**links, **self.links}
+
+
+def collapse_releases(release_lists):
+    """Creates the releases of a feed from the cached release lists of its artists.
+
+    Releases are merged by release group (by MBID without one) across all artists and
+    returned newest first, releases without a date last. Editions of a group can be anywhere
+    in the artists' lists, so all releases are collected and sorted once instead of lazily
+    merging the sorted lists (heapq.merge) as feeds were built before."""
+    releases = {}
+    for release_list in release_lists:
+        for release_dict in release_list:
+            release = Release.from_dict(release_dict)
+            key = release.release_group_id or release.id
+            existing = releases.get(key)
+            if existing is None:
+                releases[key] = release
+            else:
+                existing.merge(release)
+    return sorted(releases.values(), key=lambda release: release.sort_date, reverse=True)
@@ -1,84 +1,92 @@
-import re
 import musicbrainzngs
 import logging
 from .config import config
-from datetime import datetime
-from email.utils import formatdate
+from . import mbclient
+from . import mbdump
+from . import metrics
+from . import models
+from .search_cache import SearchCache, normalize_query
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
 
+# MusicBrainz web service client or local dump, created by init_musicbrainz
+client = None
+
+# maximum page size accepted by the MusicBrainz browse endpoints
+BROWSE_PAGE_SIZE = 100
+
+SEARCH_LIMIT = 10
+
+# artists looked up by MBID per search request, MusicBrainz returns at most 100 search results
+ARTIST_LOOKUP_BATCH_SIZE = 25
+
+_search_cache = SearchCache(config.SEARCH_CACHE_SIZE, config.SEARCH_CACHE_TTL_SECONDS)
+
 def init_musicbrainz():
+    global client
     app_name = config.MB_APP_NAME
     version = config.MB_VERSION
     contact = config.MB_CONTACT
 
     logger.debug(f"Initializing MusicBrainz API with user agent: {app_name}/{version} ( {contact} )")
     musicbrainzngs.set_useragent(app_name, version, contact)
+    if config.RELEASE_SOURCE == 'dump':
+        client = mbdump.DumpClient(config.MB_DUMP_DB_PATH)
+        logger.debug(f"Using the MusicBrainz dump at {config.MB_DUMP_DB_PATH}")
+        return
+    client = mbclient.create_client(config)
+    logger.debug(f"Using MusicBrainz at {config.MB_HOSTNAME} with {config.MB_RATE_LIMIT} requests/s")
+
+def _get_match_text(artist):
+    """Returns the names an artist is found by, for filtering cached search results."""
+    names = [artist['name'], artist.get('sort-name', '')]
+    names.extend(alias.get('alias', '') for alias in artist.get('alias-list', []))
+    return normalize_query(' '.join(names))
+
 
 def search_artists(query):
+    """Searches artists by name, answering repeated and narrowed queries from the search cache.
+
+    Searches take a low priority in the rate limiter, so they wait for feed builds."""
+    normalized = normalize_query(query)
+    artists = _search_cache.get(normalized)
+    if artists is not None:
+        logger.debug(f"Found {len(artists)} cached artists for query: '{query}'")
+        return artists
+
     logger.debug(f"Searching for artists with query: '{query}'")
     try:
-        result = musicbrainzngs.search_artists(query=query, limit=10)
-        artists = []
-        if 'artist-list' in result:
-            for artist in result['artist-list']:
-                artists.append({
-                    'id': artist['id'],
-                    'name': artist['name'],
-                    'disambiguation': artist.get('disambiguation', '')
-                })
-        logger.debug(f"Found {len(artists)} artists for query: '{query}'")
-        return artists
+        result = client.search_artists(query, limit=SEARCH_LIMIT, low_priority=True)
+        results = []
+        for artist in result.get('artist-list', []):
+            results.append(({
+                'id': artist['id'],
+                'name': artist['name'],
+                'disambiguation': artist.get('disambiguation', '')
+            }, _get_match_text(artist)))
+        complete = int(result.get('artist-count', len(results))) <= len(results)
+        _search_cache.put(normalized, results, complete)
+        logger.debug(f"Found {len(results)} artists for query: '{query}'")
+        return [artist for artist, _ in results]
     except musicbrainzngs.MusicBrainzError as e:
         logger.error(f"MusicBrainz API error while searching for '{query}': {e}")
         return []
 
-def _parse_release_date(release_date_str, release_title):
-    """Parse a release date string which can be YYYY, YYYY-MM, or YYYY-MM-DD."""
-    if not release_date_str:
-        return None, None
-
-    date_formats = ['%Y-%m-%d', '%Y-%m', '%Y']
-    dt = None
-    for fmt in date_formats:
-        try:
-            dt = datetime.strptime(release_date_str, fmt)
-            if fmt == '%Y-%m':
-                dt = dt.replace(day=1)
-            elif fmt == '%Y':
-                dt = dt.replace(month=1, day=1)
-            break  # Found a valid format
-        except (ValueError, TypeError):
-            continue
-
-    if dt:
-        return dt, formatdate(dt.timestamp())
-    
-    logger.warning(f"Could not parse date format '{release_date_str}' for release '{release_title}'")
-    return None, None
+def lookup_artist_names(artist_ids):
+    """Looks up the names of several artists by MBID with one search request.
+
+    Returns {artist_id: name} for the artists that were found, errors are raised as
+    musicbrainzngs.MusicBrainzError."""
+    query = ' OR '.join(f"arid:{artist_id}" for artist_id in artist_ids)
+    result = client.search_artists(query, limit=len(artist_ids), low_priority=True)
+    wanted = set(artist_ids)
+    return {artist['id']: artist['name'] for artist in result.get('artist-list', []) if artist['id'] in wanted}
 
 def _process_release(release, artist_id):
-    """Process a single release from the MusicBrainz API response."""
-    release_date = release.get('date', 'Unknown')
-    _, pub_date = _parse_release_date(release_date, release['title'])
-
-    links = {}
-    if 'url-relation-list' in release:
-        links = get_artist_relation_links(release['url-relation-list'])
-
-    return {
-        'artist': {
-            'name': config.get_artist_name(artist_id),
-            'id': artist_id,
-        },
-        'hasCoverArt': release.get('cover-art-archive', {}).get('artwork') == 'true',
-        'id': release['id'],
-        'title': release['title'],
-        'date': release_date,
-        'pub_date': pub_date,
-        'release-group': release.get('release-group', {}),
-        'links': links,
-    }
+    """Process a single release from the MusicBrainz API response into its artist cache form."""
+    return models.Release.from_musicbrainz(release, artist_id, config.get_artist_name(artist_id)).to_dict()
+
 def get_artist_meta_by_id(artist_id):
     """get additional meta data about an artist"""
     meta = {
@@ -87,7 +95,7 @@ def get_artist_meta_by_id(artist_id):
     try:
         logger.debug(f"Fetching artist {artist_id} meta data")
         # Fetch artist data including URL relations
-        result = musicbrainzngs.get_artist_by_id(artist_id, includes=["url-rels"])
+        result = client.get_artist_by_id(artist_id, includes=["url-rels"])
         artist_data = result.get('artist', {})
 
         if 'url-relation-list' in artist_data:
@@ -104,44 +112,67 @@ def get_artist_meta_by_id(artist_id):
 
 def get_artist_relation_links(relationlist):
     """Parse and extract named links from a MusicBrainz URL relation list."""
-    links = {}
-    for rel in relationlist:
-        target = rel.get('target')
-        if not target:
-            continue
-        if re.match(r'^https://([^/]+\.)?imdb\.com', target):
-            links['IMDb'] = target
-        elif re.match(r'^https://music\.apple\.com', target):
-            links['apple'] = target
-        elif re.match(r'^https://music\.amazon\.com', target):
-            links['amazon'] = target
-        elif re.match(r'^https://open\.spotify\.com', target):
-            links['spotify'] = target
-        elif re.match(r'^https://([^/]+\.)?qobuz\.com', target):
-            links['qobuz'] = target
-        elif re.match(r'^https://([^/]+\.)?deezer\.com', target):
-            links['deezer'] = target
-        elif re.match(r'^https://([^/]+\.)?beatport\.com', target):
-            links['beatport'] = target
-    return links
-
-def get_artist_releases(artist_id):
-    """Fetch releases for a given artist ID from MusicBrainz."""
+    return models.get_relation_links(relationlist)
+
+def _browse_release_page(artist_id, offset):
+    """Fetch one page of album releases for an artist, returns the processed releases and the total count."""
+    result = client.browse_releases(
+        artist=artist_id,
+        release_type=['album'],
+        includes=['release-groups', 'url-rels'],
+        limit=BROWSE_PAGE_SIZE,
+        offset=offset
+    )
+    page = [_process_release(r, artist_id) for r in result.get('release-list', [])]
+    return page, int(result.get('release-count', 0))
+
+def get_artist_releases(artist_id, known_releases=None):
+    """Fetch all album releases for a given artist ID from MusicBrainz, page by page.
+
+    If known_releases (the result of a previous call) is given, the first page is compared
+    against it: when the release count is unchanged and the page holds no unknown release,
+    the known releases are returned updated with the first page and no further pages are read.
+    Changes on later pages are then missed, so returns the releases and whether every page
+    was read.
+
+    Errors are raised as musicbrainzngs.MusicBrainzError, so callers can tell a failed fetch
+    from an artist without releases."""
+    with metrics.timed(metrics.artist_fetch_seconds):
+        return _get_artist_releases(artist_id, known_releases)
+
+def _get_artist_releases(artist_id, known_releases):
     artist_name = config.get_artist_name(artist_id)
     logger.debug(f"Fetching releases for artist {artist_name} ({artist_id})")
     try:
-        result = musicbrainzngs.browse_releases(
-            artist=artist_id,
-            release_type=['album'],
-            includes=['release-groups', 'url-rels']
-        )
-        
-        releases = []
-        if 'release-list' in result:
-            releases = [_process_release(r, artist_id) for r in result['release-list']]
+        releases, release_count = _browse_release_page(artist_id, 0)
+
+        if known_releases is not None and release_count == len(known_releases):
+            known_by_id = {r['id']: r for r in known_releases}
+            if all(r['id'] in known_by_id for r in releases):
+                known_by_id.update((r['id'], r) for r in releases)
+                logger.debug(f"No new releases for artist {artist_name} ({artist_id})")
+                return list(known_by_id.values()), len(releases) >= release_count
+
+        # browse results are not ordered by date, so every page has to be read
+        while releases and len(releases) < release_count:
+            page, release_count = _browse_release_page(artist_id, len(releases))
+            if not page:
+                break
+            releases.extend(page)
 
         logger.debug(f"Found {len(releases)} releases for artist {artist_name} ({artist_id})")
-        return releases
+        return releases, True
     except musicbrainzngs.MusicBrainzError as e:
         logger.error(f"MusicBrainz API error while fetching releases for artist '{artist_id}': {e}")
-        return []
+        raise
+
+def filter_releases_by_age(releases, days_back):
+    """Drop releases older than days_back days. A days_back of 0 keeps all releases.
+
+    Partial dates (YYYY, YYYY-MM) count as the last day of the period, so a release known
+    only by its year or month is kept while any part of it is in the window. Releases without
+    a date are dropped."""
+    if not days_back:
+        return releases
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=int(days_back))).strftime('%Y-%m-%d')
+    return [r for r in releases if models.pad_date(r.get('date', ''), end=True) >= cutoff]
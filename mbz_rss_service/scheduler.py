@@ -0,0 +1,89 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class FeedRefreshScheduler:
+    """Rebuilds feeds in a background thread, one at a time.
+
+    Feeds are either enqueued explicitly (e.g. when a stale feed was served) or found by a
+    periodic scan over all feeds using the is_due callback. Builds are spaced by
+    spacing_seconds so that background refreshes leave room in the MusicBrainz rate limit
+    for interactive requests. The first scan is delayed by a random part of
+    first_scan_jitter_seconds, so workers started together do not all scan at once.
+    """
+
+    def __init__(self, get_feeds, is_due, build_feed, scan_interval_seconds=300, spacing_seconds=5,
+                 first_scan_jitter_seconds=0):
+        self._get_feeds = get_feeds
+        self._is_due = is_due
+        self._build_feed = build_feed
+        self._scan_interval_seconds = scan_interval_seconds
+        self._spacing_seconds = spacing_seconds
+        self._first_scan_jitter_seconds = first_scan_jitter_seconds
+        self._queue = deque()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._thread = threading.Thread(target=self._run, name='feed-refresh', daemon=True)
+        self._thread.start()
+        logger.info(f"Started background feed refresh (scan every {self._scan_interval_seconds}s, "
+                    f"{self._spacing_seconds}s between builds)")
+
+    def enqueue(self, feed_id):
+        """Schedules a feed for rebuilding, returns False if it is already queued."""
+        with self._lock:
+            if feed_id in self._queued:
+                return False
+            self._queued.add(feed_id)
+            self._queue.append(feed_id)
+        self._wakeup.set()
+        return True
+
+    def _scan(self):
+        for feed in self._get_feeds():
+            try:
+                if self._is_due(feed) and self.enqueue(feed['id']):
+                    logger.debug(f"Feed {feed['id']} is due for a refresh")
+            except Exception as e:
+                logger.warning(f"Could not check feed {feed.get('id')} for refresh: {e}")
+
+    def _next(self):
+        with self._lock:
+            if not self._queue:
+                return None
+            feed_id = self._queue.popleft()
+            self._queued.discard(feed_id)
+            return feed_id
+
+    def _run(self):
+        next_scan = time.monotonic() + random.uniform(0, self._first_scan_jitter_seconds)
+        while True:
+            if time.monotonic() >= next_scan:
+                self._scan()
+                next_scan = time.monotonic() + self._scan_interval_seconds
+
+            feed_id = self._next()
+            if feed_id is None:
+                self._wakeup.wait(max(0, next_scan - time.monotonic()))
+                self._wakeup.clear()
+                continue
+
+            try:
+                logger.debug(f"Refreshing feed {feed_id} in background")
+                self._build_feed(feed_id)
+            except Exception as e:
+                logger.error(f"Background refresh of feed {feed_id} failed: {e}")
+            time.sleep(self._spacing_seconds)
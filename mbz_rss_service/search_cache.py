@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Normalizes a search query for cache lookups: case folded with collapsed whitespace."""
+    return ' '.join(query.casefold().split())
+
+
+def matches(query, text):
+    """Checks if every word of a normalized query occurs in a normalized text."""
+    return all(word in text for word in query.split())
+
+
+class SearchCache:
+    """A TTL and size bounded LRU of artist search results keyed by normalized query.
+
+    Results are stored as (artist, match_text) pairs. A result set that holds every match of
+    its query (complete) also answers longer queries starting with it, e.g. "radioh" from
+    "radio", by filtering the cached artists on their match text."""
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _get_valid(self, query, now):
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._entries[query]
+            return None
+        self._entries.move_to_end(query)
+        return entry
+
+    def get(self, query):
+        """Returns the cached artists for a normalized query, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._get_valid(query, now)
+            if entry is not None:
+                return [artist for artist, _ in entry[1]]
+            for length in range(len(query) - 1, 0, -1):
+                entry = self._get_valid(query[:length], now)
+                if entry is not None and entry[2]:
+                    return [artist for artist, text in entry[1] if matches(query, text)]
+        return None
+
+    def put(self, query, results, complete):
+        """Caches the (artist, match_text) results of a normalized query."""
+        with self._lock:
+            self._entries.pop(query, None)
+            self._entries[query] = (time.monotonic() + self.ttl_seconds, results, complete)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
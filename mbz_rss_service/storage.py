@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import yaml
+from . import metrics
+
+# the libyaml bindings parse and emit much faster, PyYAML falls back to pure Python without them
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+from .fsutil import atomic_write, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+def connect_sqlite(db_path, script=None):
+    """Opens a SQLite connection in autocommit mode with WAL journaling, then runs script."""
+    connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    if script:
+        connection.executescript(script)
+    return connection
+
+
+class SqliteConnections:
+    """One SQLite connection per thread, see connect_sqlite.
+
+    Connections must not be shared with forked worker processes, e.g. after a gunicorn
+    --preload, so a connection opened by another process is replaced."""
+
+    def __init__(self, db_path, script=None):
+        self.db_path = db_path
+        self.script = script
+        self._local = threading.local()
+
+    def get(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = connect_sqlite(self.db_path, self.script)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+def load_yaml(file_path):
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader) or {}
+
+
+def save_yaml(data, file_path):
+    """Atomically replaces a YAML file, keeping a timestamped backup of the previous version."""
+    if os.path.exists(file_path):
+        backup_path = f"{file_path}.{datetime.now().strftime('%Y%m%d%H%M%S')}.bak"
+        shutil.copy(file_path, backup_path)
+
+    logger.debug(f"Saving yaml to {file_path}")
+    with metrics.timed(metrics.yaml_save_seconds, 'yaml_save'):
+        atomic_write(file_path, yaml.dump(data, Dumper=SafeDumper, default_flow_style=False, sort_keys=False))
+    logger.debug(f"Saved yaml to {file_path}")
+
+
+def file_stamp(file_path):
+    """Identifies the current version of a file, files are replaced atomically on save."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class YamlFeedStore:
+    """Stores all feeds in one YAML file, every change rewrites the whole file.
+
+    The write methods return the stamp before and after the write, see Config._commit."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def stamp(self):
+        return file_stamp(self.file_path)
+
+    def load(self):
+        return load_yaml(self.file_path)
+
+    def locked(self):
+        """Serializes read-modify-write cycles of the file across worker processes."""
+        return file_lock(f"{self.file_path}.lock")
+
+    def save(self, feeds_data):
+        previous = self.stamp()
+        save_yaml(feeds_data, self.file_path)
+        return previous, self.stamp()
+
+    def add_feed(self, feeds_data, feed):
+        return self.save(feeds_data)
+
+    def delete_feed(self, feeds_data, feed_id):
+        return self.save(feeds_data)
+
+    def add_artist(self, feeds_data, feed, artist):
+        return self.save(feeds_data)
+
+    def add_artists(self, feeds_data, feed, artists):
+        return self.save(feeds_data)
+
+    def remove_artist(self, feeds_data, feed, artist_id):
+        return self.save(feeds_data)
+
+
+class SqliteFeedStore:
+    """Stores feeds, artists, feed membership and cached artist releases in SQLite.
+
+    Changes are single-row updates in their own transaction. A generation counter is
+    incremented by every change so other workers can cheaply detect that they need to reload."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS feeds (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS artists (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            links TEXT
+        );
+        CREATE TABLE IF NOT EXISTS feed_artists (
+            feed_id TEXT NOT NULL REFERENCES feeds(id) ON DELETE CASCADE,
+            artist_id TEXT NOT NULL REFERENCES artists(id),
+            PRIMARY KEY (feed_id, artist_id)
+        );
+        CREATE INDEX IF NOT EXISTS feed_artists_artist ON feed_artists(artist_id);
+        CREATE TABLE IF NOT EXISTS artist_releases (
+            artist_id TEXT PRIMARY KEY,
+            fetched_at TEXT NOT NULL,
+            entry TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO store_meta (key, value) VALUES ('generation', 0);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connections = SqliteConnections(db_path, 'PRAGMA foreign_keys=ON;')
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        return self._connections.get()
+
+    @contextmanager
+    def _transaction(self):
+        """Runs a write transaction and bumps the generation, yields the connection."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+            connection.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'generation'")
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _write(self, fn, *args):
+        with self._transaction() as connection:
+            previous = self._generation(connection)
+            fn(connection, *args)
+        return previous, previous + 1
+
+    def _generation(self, connection):
+        return connection.execute("SELECT value FROM store_meta WHERE key = 'generation'").fetchone()[0]
+
+    def stamp(self):
+        return self._generation(self._connection())
+
+    def locked(self):
+        # every change is its own transaction, no lock is needed around read-modify-write
+        return nullcontext()
+
+    def load(self):
+        connection = self._connection()
+        feeds = []
+        by_id = {}
+        for feed_id, name, created_at, updated_at in connection.execute(
+                'SELECT id, name, created_at, updated_at FROM feeds ORDER BY rowid'):
+            feed = {'id': feed_id, 'name': name, 'artists': [], 'created_at': created_at, 'updated_at': updated_at}
+            feeds.append(feed)
+            by_id[feed_id] = feed
+        for feed_id, artist_id, name, links in connection.execute(
+                'SELECT fa.feed_id, a.id, a.name, a.links FROM feed_artists fa '
+                'JOIN artists a ON a.id = fa.artist_id ORDER BY fa.rowid'):
+            artist = {'id': artist_id, 'name': name}
+            if links:
+                artist['links'] = json.loads(links)
+            by_id[feed_id]['artists'].append(artist)
+        return {'feeds': feeds}
+
+    def _insert_feed(self, connection, feed):
+        connection.execute('INSERT INTO feeds (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                           (feed['id'], feed['name'], feed.get('created_at'), feed.get('updated_at')))
+        for artist in feed.get('artists', []):
+            self._insert_artist(connection, feed['id'], artist)
+
+    def _insert_artist(self, connection, feed_id, artist):
+        links = json.dumps(artist['links']) if artist.get('links') else None
+        # an artist added again, e.g. through the search after an import without links, updates the stored one
+        connection.execute('INSERT INTO artists (id, name, links) VALUES (?, ?, ?) ON CONFLICT(id) DO UPDATE '
+                           'SET name = excluded.name, links = COALESCE(excluded.links, artists.links)',
+                           (artist['id'], artist['name'], links))
+        connection.execute('INSERT OR IGNORE INTO feed_artists (feed_id, artist_id) VALUES (?, ?)',
+                           (feed_id, artist['id']))
+
+    def _replace_all(self, connection, feeds_data):
+        connection.execute('DELETE FROM feed_artists')
+        connection.execute('DELETE FROM feeds')
+        connection.execute('DELETE FROM artists')
+        for feed in feeds_data.get('feeds', []):
+            self._insert_feed(connection, feed)
+
+    def _set_updated_at(self, connection, feed):
+        connection.execute('UPDATE feeds SET updated_at = ? WHERE id = ?', (feed.get('updated_at'), feed['id']))
+
+    def save(self, feeds_data):
+        """Replaces all feeds and artists, used to import a YAML configuration."""
+        return self._write(self._replace_all, feeds_data)
+
+    def add_feed(self, feeds_data, feed):
+        return self._write(self._insert_feed, feed)
+
+    def delete_feed(self, feeds_data, feed_id):
+        return self._write(lambda connection: connection.execute('DELETE FROM feeds WHERE id = ?', (feed_id,)))
+
+    def add_artist(self, feeds_data, feed, artist):
+        def add(connection):
+            self._insert_artist(connection, feed['id'], artist)
+            self._set_updated_at(connection, feed)
+        return self._write(add)
+
+    def add_artists(self, feeds_data, feed, artists):
+        def add(connection):
+            for artist in artists:
+                self._insert_artist(connection, feed['id'], artist)
+            self._set_updated_at(connection, feed)
+        return self._write(add)
+
+    def remove_artist(self, feeds_data, feed, artist_id):
+        def remove(connection):
+            connection.execute('DELETE FROM feed_artists WHERE feed_id = ? AND artist_id = ?', (feed['id'], artist_id))
+            connection.execute('DELETE FROM artists WHERE id = ? AND id NOT IN (SELECT artist_id FROM feed_artists)',
+                               (artist_id,))
+            self._set_updated_at(connection, feed)
+        return self._write(remove)
+
+    def load_artist_entry(self, artist_id):
+        row = self._connection().execute('SELECT entry FROM artist_releases WHERE artist_id = ?', (artist_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_artist_entries_except(self, artist_ids):
+        """Deletes the cached releases and the records of artists that are not in artist_ids."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('CREATE TEMP TABLE IF NOT EXISTS keep_artists (id TEXT PRIMARY KEY)')
+            connection.execute('DELETE FROM keep_artists')
+            connection.executemany('INSERT INTO keep_artists (id) VALUES (?)', ((a,) for a in artist_ids))
+            deleted = connection.execute(
+                'DELETE FROM artist_releases WHERE artist_id NOT IN (SELECT id FROM keep_artists)').rowcount
+            connection.execute('DELETE FROM artists WHERE id NOT IN (SELECT artist_id FROM feed_artists)')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return deleted
+
+    def save_artist_entry(self, entry):
+        # cached releases are not part of the feed configuration, so the generation is left alone,
+        # failure-only entries were never fetched and are stored with an empty fetched_at
+        self._connection().execute(
+            'INSERT OR REPLACE INTO artist_releases (artist_id, fetched_at, entry) VALUES (?, ?, ?)',
+            (entry['artist_id'], entry['fetched_at'] or '', json.dumps(entry)))
+
+
+def create_feed_store(backend, feeds_file_path, sqlite_path):
+    if backend == 'sqlite':
+        logger.debug(f"Using SQLite feed storage at {sqlite_path}")
+        return SqliteFeedStore(sqlite_path)
+    return YamlFeedStore(feeds_file_path)
@@ -0,0 +1,42 @@
+"""Runs the service against a temporary data directory and the MusicBrainz stub of the benchmarks.
+
+The configuration is read from the environment on import, so it is set up before any
+mbz_rss_service module is imported."""
+import os
+import tempfile
+import threading
+import pytest
+from benchmarks.mbstub import create_server
+
+_data_dir = tempfile.mkdtemp(prefix='mbz-test-')
+_stub = create_server()
+threading.Thread(target=_stub.serve_forever, daemon=True).start()
+
+os.environ.update(
+    FEEDS_FILE_PATH=os.path.join(_data_dir, 'feeds.yml'),
+    CONFIG_FILE_PATH=os.path.join(_data_dir, 'etc', 'mbz-rss-feeder.yml'),
+    CACHE_DIR=os.path.join(_data_dir, 'cache'),
+    LOG_FILE=os.path.join(_data_dir, 'log', 'mbz-rss-feeder.log'),
+    MB_HOSTNAME=f"127.0.0.1:{_stub.server_address[1]}",
+    MB_HTTPS='false',
+    MB_RATE_LIMIT='1000',
+    MB_RATE_BURST='100',
+    BACKGROUND_REFRESH='false',
+    HOUSEKEEPING_INTERVAL_SECONDS='0',
+    SERVER_TIMING='true',
+)
+
+
+@pytest.fixture
+def client():
+    from mbz_rss_service import main
+    return main.app.test_client()
+
+
+@pytest.fixture
+def feed():
+    """A new feed, deleted after the test."""
+    from mbz_rss_service.config import config
+    new_feed = config.add_feed('Test')
+    yield new_feed
+    config.delete_feed(new_feed['id'])
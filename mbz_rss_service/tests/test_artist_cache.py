@@ -0,0 +1,42 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+import musicbrainzngs
+from mbz_rss_service import artist_cache
+from mbz_rss_service import musicbrainz
+
+
+def test_failed_first_fetch_is_not_retried_before_backoff(monkeypatch):
+    calls = []
+
+    def failing_fetch(artist_id, known_releases=None):
+        calls.append(artist_id)
+        raise musicbrainzngs.NetworkError('unavailable')
+
+    monkeypatch.setattr(musicbrainz, 'get_artist_releases', failing_fetch)
+    artist_id = str(uuid.uuid4())
+
+    for _ in range(2):
+        release_lists, failed_ids = artist_cache.get_feed_releases([artist_id])
+        assert release_lists == [[]]
+        assert failed_ids == [artist_id]
+    assert calls == [artist_id]
+
+
+def test_full_fetch_picks_up_changes_on_later_pages(monkeypatch):
+    artist_id = str(uuid.uuid4())
+    source = [{'id': str(uuid.uuid4()), 'title': f"Release {n}", 'date': '2020-01-01'} for n in range(150)]
+
+    def browse_page(browsed_artist_id, offset):
+        return [dict(release) for release in source[offset:offset + musicbrainz.BROWSE_PAGE_SIZE]], len(source)
+
+    monkeypatch.setattr(musicbrainz, '_browse_release_page', browse_page)
+    entry = artist_cache._fetch_entry(artist_id, None)
+    source[120]['title'] = 'Corrected'
+
+    # an incremental refresh only reads the unchanged first page
+    entry = artist_cache._fetch_entry(artist_id, entry)
+    assert 'Corrected' not in {release['title'] for release in entry['releases']}
+
+    entry['full_fetched_at'] = (datetime.now(timezone.utc) - timedelta(days=8)).isoformat()
+    entry = artist_cache._fetch_entry(artist_id, entry)
+    assert 'Corrected' in {release['title'] for release in entry['releases']}
@@ -0,0 +1,22 @@
+import uuid
+import pytest
+from mbz_rss_service import bulk_import
+from mbz_rss_service.config import config
+
+
+@pytest.mark.parametrize('suffix', ['', '.atom', '.json'])
+def test_exported_feed_imports_its_artists(client, feed, suffix):
+    artist_ids = [str(uuid.uuid4()) for _ in range(3)]
+    config.add_artists_to_feed(feed['id'], [{'id': artist_id, 'name': f"Artist {n}"}
+                                            for n, artist_id in enumerate(artist_ids)])
+    exported = client.get(f"/feed/{feed['id']}{suffix}").get_data(as_text=True)
+
+    assert feed['id'] in exported
+    assert sorted(bulk_import.extract_artist_ids(exported)) == sorted(artist_ids)
+
+
+def test_lists_take_bare_ids():
+    artist_id, release_id = str(uuid.uuid4()), str(uuid.uuid4())
+    text = f"{artist_id.upper()}\nhttps://musicbrainz.org/release/{release_id}\n{artist_id}\n"
+
+    assert bulk_import.extract_artist_ids(text) == [artist_id]
@@ -0,0 +1,49 @@
+import json
+from mbz_rss_service import feed_cache
+from mbz_rss_service.feed_cache import MemoryCache
+
+
+def test_memory_cache_evicts_least_recently_used_bytes():
+    cache = MemoryCache(max_bytes=10)
+    cache.put('a', 'etag', b'1234')
+    cache.put('b', 'etag', b'1234')
+    assert cache.get('a', 'etag') == b'1234'
+
+    cache.put('c', 'etag', b'1234')
+
+    assert cache.get('b', 'etag') is None
+    assert cache.get('a', 'etag') == b'1234'
+    assert cache.get('c', 'etag') == b'1234'
+    assert cache._size == 8
+
+
+def test_memory_cache_skips_entries_larger_than_the_cache():
+    cache = MemoryCache(max_bytes=10)
+    cache.put('a', 'etag', b'1234')
+    cache.put('b', 'etag', b'x' * 11)
+
+    assert cache.get('b', 'etag') is None
+    assert cache.get('a', 'etag') == b'1234'
+
+
+def test_memory_cache_drops_entries_of_another_build():
+    cache = MemoryCache(max_bytes=10)
+    cache.put('a', 'old', b'1234')
+
+    assert cache.get('a', 'new') is None
+    assert cache.get('a', 'old') is None
+    assert cache._size == 0
+
+
+def test_read_feed_follows_a_rebuild_in_another_worker(client, feed):
+    client.get(f"/feed/{feed['id']}")
+    meta = feed_cache.get_meta(feed['id'])
+    assert feed_cache.read_feed(feed['id'], meta) == client.get(f"/feed/{feed['id']}").data
+
+    # another worker replaces the cache file and its metadata
+    with open(feed_cache.get_cache_file_path(feed['id']), 'wb') as f:
+        f.write(b'<rss>rebuilt</rss>')
+    with open(feed_cache.get_meta_file_path(feed['id']), 'w') as f:
+        json.dump(dict(meta, etag='rebuilt', size=18), f)
+
+    assert feed_cache.read_feed(feed['id'], feed_cache.get_meta(feed['id'])) == b'<rss>rebuilt</rss>'
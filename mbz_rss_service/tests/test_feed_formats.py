@@ -0,0 +1,59 @@
+import json
+import os
+import uuid
+import xml.etree.ElementTree as ElementTree
+import pytest
+from mbz_rss_service import storage
+from mbz_rss_service.config import config
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+@pytest.fixture
+def artist_feed(feed):
+    storage.save_yaml({'service': {'days_back': 0, 'max_items': 10}}, config.CONFIG_FILE_PATH)
+    config.add_artist_to_feed(feed['id'], str(uuid.uuid4()), 'Format Artist')
+    yield feed
+    os.unlink(config.CONFIG_FILE_PATH)
+
+
+def test_atom_feed(client, artist_feed):
+    response = client.get(f"/feed/{artist_feed['id']}.atom")
+    assert response.status_code == 200
+    assert response.mimetype == 'application/atom+xml'
+
+    root = ElementTree.fromstring(response.get_data())
+    assert root.find(f'{ATOM}title').text == 'Test'
+    entries = root.findall(f'{ATOM}entry')
+    assert len(entries) == 10
+    assert entries[0].find(f'{ATOM}author/{ATOM}name').text == 'Format Artist'
+
+
+def test_json_feed(client, artist_feed):
+    response = client.get(f"/feed/{artist_feed['id']}.json")
+    assert response.status_code == 200
+    assert response.mimetype == 'application/feed+json'
+
+    document = json.loads(response.get_data())
+    assert document['version'] == 'https://jsonfeed.org/version/1.1'
+    assert len(document['items']) == 10
+    assert document['items'][0]['authors'][0]['name'] == 'Format Artist'
+
+
+@pytest.mark.parametrize('accept, mimetype', [
+    (None, 'application/xml'),
+    ('application/atom+xml', 'application/atom+xml'),
+    ('application/json', 'application/feed+json'),
+    ('text/html, application/feed+json;q=0.9, application/xml;q=0.5', 'application/feed+json'),
+])
+def test_accept_negotiation(client, artist_feed, accept, mimetype):
+    headers = {'Accept': accept} if accept else {}
+    response = client.get(f"/feed/{artist_feed['id']}", headers=headers)
+    response.get_data()
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.vary
+
+
+def test_unknown_format_is_not_found(client, artist_feed):
+    assert client.get(f"/feed/{artist_feed['id']}.csv").status_code == 404
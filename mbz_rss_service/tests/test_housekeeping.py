@@ -0,0 +1,47 @@
+import uuid
+import pytest
+from mbz_rss_service import artist_cache
+from mbz_rss_service import housekeeping
+from mbz_rss_service.config import config
+
+
+@pytest.fixture
+def cached_artist(feed):
+    artist_id = str(uuid.uuid4())
+    config.add_artist_to_feed(feed['id'], artist_id, 'Kept Artist')
+    artist_cache._write_entry({'artist_id': artist_id, 'releases': []})
+    return artist_id
+
+
+def _cached_ids():
+    return {entry_id for _, entry_id in housekeeping._collect_cache_entries()}
+
+
+def test_unconfigured_artists_are_removed(feed, cached_artist):
+    orphan_id = str(uuid.uuid4())
+    artist_cache._write_entry({'artist_id': orphan_id, 'releases': []})
+
+    report = housekeeping.remove_orphans(housekeeping._collect_cache_entries())
+
+    assert not report['skipped'] and report['artists'] >= 1
+    assert cached_artist in _cached_ids() and orphan_id not in _cached_ids()
+
+
+def test_empty_configuration_keeps_the_cache(monkeypatch, cached_artist):
+    monkeypatch.setattr(type(config), 'feeds', property(lambda self: []))
+
+    report = housekeeping.remove_orphans(housekeeping._collect_cache_entries())
+
+    assert report['skipped'] and report['artists'] == 0
+    assert cached_artist in _cached_ids()
+
+
+def test_unreadable_feeds_keep_the_cache(monkeypatch, cached_artist):
+    def fail(self):
+        raise OSError('feeds.yml is not readable')
+    monkeypatch.setattr(type(config), 'feeds', property(fail))
+
+    report = housekeeping.remove_orphans(housekeeping._collect_cache_entries())
+
+    assert report['skipped'] and report['artists'] == 0
+    assert cached_artist in _cached_ids()
@@ -0,0 +1,145 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import musicbrainzngs
+import pytest
+from mbz_rss_service import mbclient
+
+ARTIST_XML = (b'<?xml version="1.0" encoding="UTF-8"?><metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+              b'<artist id="a74b1b7f-71a5-4011-9441-d0b5e4122711"><name>Radiohead</name></artist></metadata>')
+
+
+class FakeClock:
+    """Stands in for the time module of mbclient, sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(mbclient, 'time', fake)
+    return fake
+
+
+def test_buckets_sharing_a_state_file_share_refill_and_burst(tmp_path, clock):
+    state_file = str(tmp_path / 'rate')
+    first = mbclient.TokenBucket(rate=2, burst=2, state_file=state_file)
+    second = mbclient.TokenBucket(rate=2, burst=2, state_file=state_file)
+
+    assert first._take() == 0
+    assert second._take() == 0
+    assert first._take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert second._take() == 0
+    # the burst caps the refill after a long pause
+    clock.now += 60
+    assert [first._take(), second._take(), first._take()] == [0, 0, pytest.approx(0.5)]
+
+
+def test_low_priority_waits_for_normal_priority_callers():
+    bucket = mbclient.TokenBucket(rate=100, burst=1)
+    bucket._waiting = 1
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (bucket.acquire(low_priority=True), done.set()))
+    thread.start()
+
+    assert not done.wait(0.1)
+    bucket._waiting = 0
+    assert done.wait(1)
+    thread.join()
+
+
+def test_breaker_opens_cools_down_and_lets_one_trial_through(clock):
+    breaker = mbclient.CircuitBreaker(failure_threshold=2, cooldown_seconds=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now += 61
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now += 61
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+@pytest.fixture
+def service():
+    """A web service answering with the queued status codes, then with 200."""
+    class Handler(BaseHTTPRequestHandler):
+        statuses = []
+        requests = 0
+
+        def do_GET(self):
+            Handler.requests += 1
+            status = Handler.statuses.pop(0) if Handler.statuses else 200
+            body = ARTIST_XML if status == 200 else b''
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def _client(server, **options):
+    return mbclient.MusicBrainzClient(f"127.0.0.1:{server.server_address[1]}", False, 'test',
+                                      mbclient.TokenBucket(rate=1000, burst=100), backoff_seconds=0.01, **options)
+
+
+def test_request_retries_503(service):
+    service.RequestHandlerClass.statuses = [503, 503]
+
+    result = _client(service, max_retries=3).request('artist/a74b1b7f-71a5-4011-9441-d0b5e4122711', {})
+
+    assert result['artist']['name'] == 'Radiohead'
+    assert service.RequestHandlerClass.requests == 3
+
+
+def test_request_gives_up_after_max_retries(service):
+    service.RequestHandlerClass.statuses = [503] * 3
+
+    with pytest.raises(musicbrainzngs.NetworkError):
+        _client(service, max_retries=2).request('artist/a74b1b7f-71a5-4011-9441-d0b5e4122711', {})
+    assert service.RequestHandlerClass.requests == 3
+
+
+def test_request_does_not_retry_client_errors(service):
+    service.RequestHandlerClass.statuses = [404]
+
+    with pytest.raises(musicbrainzngs.ResponseError):
+        _client(service).request('artist/a74b1b7f-71a5-4011-9441-d0b5e4122711', {})
+    assert service.RequestHandlerClass.requests == 1
+
+
+def test_open_breaker_fails_fast(service):
+    service.RequestHandlerClass.statuses = [503] * 2
+    client = _client(service, max_retries=5, breaker=mbclient.CircuitBreaker(failure_threshold=2))
+
+    start = time.monotonic()
+    with pytest.raises(musicbrainzngs.NetworkError, match='circuit open'):
+        client.request('artist/a74b1b7f-71a5-4011-9441-d0b5e4122711', {})
+    assert service.RequestHandlerClass.requests == 2
+    assert time.monotonic() - start < 1
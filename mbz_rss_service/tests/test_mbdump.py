@@ -0,0 +1,59 @@
+import gzip
+import os
+import shutil
+import musicbrainzngs
+import pytest
+from mbz_rss_service import mbdump
+from mbz_rss_service import models
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks', 'fixtures', 'mbdump')
+RADIOHEAD_ID = 'a74b1b7f-71a5-4011-9441-d0b5e4122711'
+RADIO_DEPT_ID = '23f7f4cd-64c9-5369-967c-37466cb9dfdd'
+
+
+@pytest.fixture
+def dump_db(tmp_path):
+    db_path = str(tmp_path / 'mbdump.db')
+    counts = mbdump.import_dump([os.path.join(FIXTURE_DIR, 'artist'), os.path.join(FIXTURE_DIR, 'release')], db_path)
+    assert counts == {'artist': 3, 'release': 22, 'skipped': 0}
+    return db_path
+
+
+def test_reimport_replaces_records(dump_db, tmp_path):
+    compressed = str(tmp_path / 'release.gz')
+    with open(os.path.join(FIXTURE_DIR, 'release'), 'rb') as f, gzip.open(compressed, 'wb') as out:
+        shutil.copyfileobj(f, out)
+
+    assert mbdump.import_dump([compressed], dump_db)['release'] == 22
+    result = mbdump.DumpClient(dump_db).browse_releases(RADIOHEAD_ID, release_type=['album'], limit=100)
+    assert result['release-count'] == len(result['release-list']) == 21
+
+
+def test_browse_releases_collapse_by_release_group(dump_db):
+    client = mbdump.DumpClient(dump_db)
+    result = client.browse_releases(RADIOHEAD_ID, release_type=['album'], includes=['release-groups', 'url-rels'],
+                                    limit=100)
+    releases = [models.Release.from_musicbrainz(release, RADIOHEAD_ID, 'Radiohead').to_dict()
+                for release in result['release-list']]
+
+    collapsed = models.collapse_releases([releases])
+
+    titles = [release.title for release in collapsed]
+    assert len(collapsed) == 15
+    assert titles.count('OK Computer') == 1
+    assert [release.sort_date for release in collapsed] == sorted((r.sort_date for r in collapsed), reverse=True)
+
+
+def test_search_artists(dump_db):
+    client = mbdump.DumpClient(dump_db)
+
+    assert [artist['name'] for artist in client.search_artists('radio')['artist-list']] == \
+        ['Radiohead', 'Radiohead Tribute Band', 'The Radio Dept.']
+    assert client.search_artists('radioh')['artist-count'] == 2
+    assert [artist['id'] for artist in client.search_artists(f"arid:{RADIO_DEPT_ID}")['artist-list']] == \
+        [RADIO_DEPT_ID]
+
+
+def test_unknown_artist_lookup_fails(dump_db):
+    with pytest.raises(musicbrainzngs.ResponseError):
+        mbdump.DumpClient(dump_db).get_artist_by_id('11111111-2222-3333-4444-555555555555')
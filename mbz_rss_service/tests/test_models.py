@@ -0,0 +1,60 @@
+from mbz_rss_service.models import Release, classify_link, collapse_releases
+
+
+def _release(id, date, group='group-1', artist=('artist-1', 'Artist One'), cover=False, links=None):
+    release = {'id': id, 'title': f"Title {id}", 'date': date, 'hasCoverArt': cover, 'links': links or {},
+               'artist': {'id': artist[0], 'name': artist[1]}}
+    if group:
+        release['release-group'] = {'id': group}
+    return release
+
+
+def test_classify_link():
+    assert classify_link('https://open.spotify.com/album/1') == 'spotify'
+    assert classify_link('https://www.imdb.com/title/tt1') == 'IMDb'
+    assert classify_link('https://m.imdb.com/title/tt1') == 'IMDb'
+    assert classify_link('http://open.spotify.com/album/1') is None
+    assert classify_link('https://example.com/spotify.com') is None
+    assert classify_link('https://notdeezer.com/album/1') is None
+
+
+def test_merge_keeps_the_earliest_edition():
+    release = Release.from_dict(_release('late', '2020-05-01', cover=True, links={'spotify': 'https://s/late'}))
+    release.merge(Release.from_dict(_release('early', '2020', links={'deezer': 'https://d/early'})))
+
+    assert release.id == 'early'
+    assert release.date == '2020' and release.sort_date == '2020-01-01'
+    assert release.cover_art_id == 'late'
+    assert release.links == {'spotify': 'https://s/late', 'deezer': 'https://d/early'}
+
+
+def test_merge_ignores_undated_editions():
+    release = Release.from_dict(_release('dated', '2021-01-01', links={'spotify': 'https://s/dated'}))
+    release.merge(Release.from_dict(_release('undated', 'Unknown', cover=True,
+                                             links={'spotify': 'https://s/undated', 'qobuz': 'https://q'})))
+
+    assert release.id == 'dated'
+    assert release.cover_art_id == 'undated'
+    assert release.links == {'spotify': 'https://s/dated', 'qobuz': 'https://q'}
+
+
+def test_collapse_releases_merges_groups_across_artists():
+    first = [_release('a', '2022-03-01', group='shared'), _release('b', 'Unknown', group=None),
+             _release('c', '2019-01-01', group='old')]
+    second = [_release('d', '2022-01-01', group='shared', artist=('artist-2', 'Artist Two')),
+              _release('e', '2023', group='new', artist=('artist-2', 'Artist Two'))]
+
+    releases = collapse_releases([first, second])
+
+    assert [release.id for release in releases] == ['e', 'd', 'c', 'b']
+    assert releases[1].artists == {'artist-1': 'Artist One', 'artist-2': 'Artist Two'}
+    assert releases[1].artist_names == 'Artist One & Artist Two'
+
+
+def test_to_dict_round_trip():
+    release_dict = _release('a', '2022-03', cover=True, links={'spotify': 'https://s/a'})
+    release_dict['pub_date'] = None
+    release = Release.from_dict(release_dict)
+
+    assert release.iso_date == '2022-03-01T00:00:00Z'
+    assert Release.from_dict(release.to_dict()).to_dict() == release.to_dict()
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta, timezone
+from mbz_rss_service import musicbrainz
+
+
+def test_filter_keeps_partial_dates_within_the_window():
+    today = datetime.now(timezone.utc)
+    old = today - timedelta(days=400)
+    releases = [
+        {'id': 'year', 'date': today.strftime('%Y')},
+        {'id': 'month', 'date': today.strftime('%Y-%m')},
+        {'id': 'day', 'date': today.strftime('%Y-%m-%d')},
+        {'id': 'old-year', 'date': str(today.year - 2)},
+        {'id': 'old-month', 'date': old.strftime('%Y-%m')},
+        {'id': 'unknown', 'date': 'Unknown'},
+    ]
+
+    kept = musicbrainz.filter_releases_by_age(releases, 30)
+
+    assert [release['id'] for release in kept] == ['year', 'month', 'day']
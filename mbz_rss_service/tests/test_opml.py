@@ -0,0 +1,21 @@
+import uuid
+from mbz_rss_service import storage
+from mbz_rss_service.config import config
+
+
+def test_opml_follows_feeds_changed_by_another_worker(client, feed):
+    response = client.get('/opml')
+    etag = response.headers['ETag']
+    outlines = response.get_data(as_text=True).count('type="rss"')
+
+    # another worker adds a feed, this one has not touched the feeds since
+    feeds_data = storage.load_yaml(config.FEEDS_FILE_PATH)
+    other_id = str(uuid.uuid4())
+    feeds_data['feeds'].append({'id': other_id, 'name': 'Other worker', 'artists': []})
+    storage.save_yaml(feeds_data, config.FEEDS_FILE_PATH)
+    try:
+        response = client.get('/opml', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).count('type="rss"') == outlines + 1
+    finally:
+        config.delete_feed(other_id)
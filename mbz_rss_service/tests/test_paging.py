@@ -0,0 +1,34 @@
+import os
+import uuid
+import pytest
+from mbz_rss_service import artist_cache
+from mbz_rss_service import storage
+from mbz_rss_service.config import config
+
+
+@pytest.fixture
+def paged_settings():
+    storage.save_yaml({'service': {'days_back': 0, 'cache_time_hours': 8, 'max_items': 10}}, config.CONFIG_FILE_PATH)
+    yield
+    os.unlink(config.CONFIG_FILE_PATH)
+
+
+def test_page_etag_changes_with_artist_entries(client, feed, paged_settings):
+    artist_id = str(uuid.uuid4())
+    config.add_artist_to_feed(feed['id'], artist_id, 'Paged Artist')
+    client.get(f"/feed/{feed['id']}")
+    response = client.get(f"/feed/{feed['id']}?page=2")
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('<item>') == 10
+    etag = response.headers['ETag']
+    assert client.get(f"/feed/{feed['id']}?page=2", headers={'If-None-Match': etag}).status_code == 304
+
+    # the artist is refreshed through another feed, the first page of this one is not rebuilt
+    entry = artist_cache._load_entry(artist_id)
+    entry['releases'][15]['title'] = 'Renamed'
+    artist_cache._write_entry(entry)
+
+    response = client.get(f"/feed/{feed['id']}?page=2", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert 'Renamed' in response.get_data(as_text=True)
@@ -0,0 +1,14 @@
+import uuid
+from mbz_rss_service import main
+from mbz_rss_service import feed_cache
+from mbz_rss_service.config import config
+
+
+def test_refresh_skips_feed_rebuilt_since_enqueued(client, feed):
+    config.add_artist_to_feed(feed['id'], str(uuid.uuid4()), 'Refreshed Artist')
+    client.get(f"/feed/{feed['id']}")
+    build_time = feed_cache.get_meta(feed['id'])['build_time']
+
+    main._refresh_feed(feed['id'])
+
+    assert feed_cache.get_meta(feed['id'])['build_time'] == build_time
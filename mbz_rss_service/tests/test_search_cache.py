@@ -0,0 +1,80 @@
+import pytest
+from mbz_rss_service import musicbrainz
+from mbz_rss_service import search_cache
+from mbz_rss_service.search_cache import SearchCache
+
+RADIOHEAD = {'id': 'a74b1b7f-71a5-4011-9441-d0b5e4122711', 'name': 'Radiohead', 'disambiguation': ''}
+RADIO_DEPT = {'id': '23f7f4cd-64c9-5369-967c-37466cb9dfdd', 'name': 'The Radio Dept.', 'disambiguation': ''}
+RESULTS = [(RADIOHEAD, 'radiohead'), (RADIO_DEPT, 'the radio dept.')]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(search_cache, 'time', fake)
+    return fake
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = SearchCache(ttl_seconds=60)
+    cache.put('radio', RESULTS, complete=True)
+
+    clock.now += 59
+    assert cache.get('radio') == [RADIOHEAD, RADIO_DEPT]
+    clock.now += 2
+    assert cache.get('radio') is None
+    assert cache.get('radiohead') is None
+
+
+def test_complete_results_answer_longer_queries(clock):
+    cache = SearchCache()
+    cache.put('radio', RESULTS, complete=True)
+
+    assert cache.get('radioh') == [RADIOHEAD]
+    assert cache.get('radio dept') == [RADIO_DEPT]
+
+
+def test_incomplete_results_only_answer_their_query(clock):
+    cache = SearchCache()
+    cache.put('radio', RESULTS, complete=False)
+
+    assert cache.get('radio') == [RADIOHEAD, RADIO_DEPT]
+    assert cache.get('radioh') is None
+
+
+def test_least_recently_used_query_is_evicted(clock):
+    cache = SearchCache(max_entries=2)
+    cache.put('a', [], complete=False)
+    cache.put('b', [], complete=False)
+    cache.get('a')
+    cache.put('c', [], complete=False)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == [] and cache.get('c') == []
+
+
+def test_search_reuses_cached_results(monkeypatch):
+    queries = []
+
+    class Client:
+        def search_artists(self, query, limit=None, offset=None, low_priority=False):
+            queries.append((query, low_priority))
+            return {'artist-list': [dict(RADIOHEAD, **{'sort-name': 'Radiohead'}),
+                                    dict(RADIO_DEPT, **{'sort-name': 'Radio Dept., The'})],
+                    'artist-count': 2}
+
+    monkeypatch.setattr(musicbrainz, 'client', Client())
+    monkeypatch.setattr(musicbrainz, '_search_cache', SearchCache())
+
+    assert musicbrainz.search_artists('Radio') == [RADIOHEAD, RADIO_DEPT]
+    assert musicbrainz.search_artists('  radio ') == [RADIOHEAD, RADIO_DEPT]
+    assert musicbrainz.search_artists('radiohe') == [RADIOHEAD]
+    assert queries == [('Radio', True)]
@@ -0,0 +1,14 @@
+import uuid
+from mbz_rss_service.config import config
+
+
+def test_cold_feed_build_reports_musicbrainz_time(client, feed):
+    config.add_artist_to_feed(feed['id'], str(uuid.uuid4()), 'Cold Artist')
+
+    response = client.get(f"/feed/{feed['id']}")
+
+    assert response.status_code == 200
+    timings = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+    assert 'mb_request' in timings
+    assert 'mb_rate_wait' in timings
+    assert 'build' in timings
@@ -0,0 +1,67 @@
+import threading
+import time
+from mbz_rss_service import main
+from mbz_rss_service.singleflight import SingleFlight
+
+
+def _run_concurrently(count, fn):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = fn()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    results = _run_concurrently(5, lambda: flight.do('feed', slow))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    # the key is released once the call is done
+    flight.do('feed', slow)
+    assert len(calls) == 2
+
+
+def test_waiting_callers_get_the_error():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError('build failed')
+
+    results = _run_concurrently(3, lambda: flight.do('feed', failing))
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_concurrent_feed_generations_build_once(feed, monkeypatch):
+    builds = []
+
+    def build(feed_data, feed_format):
+        builds.append(feed_format)
+        time.sleep(0.1)
+
+    monkeypatch.setattr(main, '_build_feed', build)
+
+    _run_concurrently(5, lambda: main._generate_feed(feed))
+
+    assert builds == ['rss']
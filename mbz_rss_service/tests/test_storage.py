@@ -0,0 +1,109 @@
+import sqlite3
+import uuid
+import pytest
+from mbz_rss_service import __main__ as cli
+from mbz_rss_service import storage
+from mbz_rss_service.config import Config
+
+
+def _feed(name='Feed'):
+    return {'id': str(uuid.uuid4()), 'name': name, 'artists': [], 'created_at': None, 'updated_at': None}
+
+
+@pytest.fixture(params=['yaml', 'sqlite'])
+def make_store(request, tmp_path):
+    """Creates stores on the same data, like the workers of one service."""
+    def make():
+        if request.param == 'sqlite':
+            return storage.SqliteFeedStore(str(tmp_path / 'feeds.db'))
+        return storage.YamlFeedStore(str(tmp_path / 'feeds.yml'))
+    return make
+
+
+def _config(store):
+    config = Config()
+    config._store = store
+    return config
+
+
+def test_config_reloads_changes_of_another_worker(make_store):
+    writer, reader = _config(make_store()), _config(make_store())
+    assert reader.feeds == []
+    generation = reader.feeds_generation
+
+    feed = writer.add_feed('Shared')
+    artist_id = str(uuid.uuid4())
+    writer.add_artist_to_feed(feed['id'], artist_id, 'Artist')
+
+    assert reader.feeds_generation != generation
+    assert reader.get_feed(feed['id'])['artists'] == [{'id': artist_id, 'name': 'Artist'}]
+    assert reader.get_artist_ids() == {artist_id}
+
+    writer.remove_artist_from_feed(feed['id'], artist_id)
+    assert reader.get_feed(feed['id'])['artists'] == []
+    writer.delete_feed(feed['id'])
+    assert reader.get_feed(feed['id']) is None
+
+
+def test_yaml_round_trip(make_store, tmp_path, monkeypatch):
+    artist = {'id': str(uuid.uuid4()), 'name': 'Both', 'links': {'spotify': 'https://open.spotify.com/artist/x'}}
+    feeds_data = {'feeds': [
+        dict(_feed('First'), artists=[artist, {'id': str(uuid.uuid4()), 'name': 'Only first'}],
+             created_at='2026-01-01T00:00:00+00:00', updated_at='2026-01-02T00:00:00+00:00'),
+        dict(_feed('Second'), artists=[artist]),
+    ]}
+    source, exported = str(tmp_path / 'source.yml'), str(tmp_path / 'exported.yml')
+    storage.save_yaml(feeds_data, source)
+    monkeypatch.setattr(cli, 'config', _config(make_store()))
+
+    assert cli.main(['import-yaml', source]) == 0
+    assert cli.main(['export-yaml', exported]) == 0
+
+    assert storage.load_yaml(exported) == feeds_data
+
+
+def test_sqlite_writes_bump_the_generation(tmp_path):
+    store = storage.SqliteFeedStore(str(tmp_path / 'feeds.db'))
+    feed = _feed()
+    start = store.stamp()
+
+    assert store.add_feed(None, feed) == (start, start + 1)
+    assert store.add_artist(None, feed, {'id': str(uuid.uuid4()), 'name': 'Artist'}) == (start + 1, start + 2)
+    with pytest.raises(sqlite3.IntegrityError):
+        store.add_feed(None, feed)
+    assert store.stamp() == start + 2
+    assert len(store.load()['feeds']) == 1
+
+
+def test_sqlite_delete_artist_entries_except(tmp_path):
+    store = storage.SqliteFeedStore(str(tmp_path / 'feeds.db'))
+    feed = _feed()
+    store.add_feed(None, feed)
+    kept, removed = str(uuid.uuid4()), str(uuid.uuid4())
+    store.add_artists(None, feed, [{'id': kept, 'name': 'Kept'}, {'id': removed, 'name': 'Removed'}])
+    store.remove_artist(None, feed, removed)
+    for artist_id in (kept, removed, str(uuid.uuid4())):
+        store.save_artist_entry({'artist_id': artist_id, 'fetched_at': '2026-01-01T00:00:00+00:00', 'releases': []})
+    generation = store.stamp()
+
+    assert store.delete_artist_entries_except({kept}) == 2
+
+    assert store.load_artist_entry(kept)['artist_id'] == kept
+    assert store.load_artist_entry(removed) is None
+    assert store.stamp() == generation
+    assert store.load()['feeds'][0]['artists'] == [{'id': kept, 'name': 'Kept'}]
+
+
+def test_sqlite_artist_added_again_is_updated(tmp_path):
+    store = storage.SqliteFeedStore(str(tmp_path / 'feeds.db'))
+    feed = _feed()
+    store.add_feed({'feeds': [feed]}, feed)
+    artist_id = str(uuid.uuid4())
+    store.add_artist(None, feed, {'id': artist_id, 'name': 'Imported'})
+    store.remove_artist(None, feed, artist_id)
+
+    links = {'spotify': 'https://open.spotify.com/artist/x'}
+    store.add_artist(None, feed, {'id': artist_id, 'name': 'Searched', 'links': links})
+    store.add_artist(None, feed, {'id': artist_id, 'name': 'Searched'})
+
+    assert store.load()['feeds'][0]['artists'] == [{'id': artist_id, 'name': 'Searched', 'links': links}]